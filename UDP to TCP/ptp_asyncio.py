@@ -0,0 +1,552 @@
+"""
+    asyncio transport for PTP
+    Python 3
+    coding: utf-8
+
+    Notes:
+        The same protocol as sender.py and receiver.py, driven by an event loop
+        instead of threads and blocking sockets, so any number of connections
+        share one thread and cancelling a task tears its connection down.
+
+        PTP carries data one way, so a client gets a writer and a server hands
+        a reader to its callback for every connection:
+
+            writer = await open_connection("127.0.0.1", 9000)
+            writer.write(data)
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+
+            async def handle(reader):
+                data = await reader.read()
+            server = await start_server(handle, "127.0.0.1", 9000)
+
+        Only full segments are sent before close(), the last short segment
+        goes out when the writer is closed.
+
+        The server advertises a window like receiver.py. In-order data goes
+        to the reader at once, until its buffer passes the limit of the
+        StreamReader; the reader then pauses the connection, and the data
+        stays in the ring of the connection, shrinking the window, until the
+        application reads and the reader resumes it. A handler that does not
+        read thus stops its sender instead of buffering the whole stream.
+"""
+import asyncio
+import logging
+import random
+import time
+
+import ptp_congestion
+import ptp_header
+from ptp_reassembly import Reassembler
+from ptp_rto import RTOEstimator
+from ptp_window import SendWindow
+
+RECEIVE_WINDOW = 1 << 18  # the ring buffer of a server connection, the largest window it advertises
+IDLE_TIMEOUT = 60  # seconds without a segment before a server connection is evicted
+
+
+class _SenderProtocol(asyncio.DatagramProtocol):
+    def __init__(self, max_win: int, rot: int, cc: str, mss: int) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.transport = None
+        self.ISN = random.randint(0, 2**16-1)
+        self.conn_id = random.randint(0, 2**32-1)
+        self.relative_0 = self.ISN + 1
+        self.header_version = ptp_header.HEADER_VERSION
+        self.rot = int(rot) / 1000
+        self.rto = RTOEstimator(self.rot)
+        self.max_win = int(max_win)
+        self.mss = max(1, min(int(mss), ptp_header.MAX_MSS))
+        self.cc_name = cc
+        self.window_scale = None  # the shift of the receiver's window, None if it advertises none
+        self.peer_window = None  # the window advertised in the ACK of the SYN, in bytes
+        self._open_window()
+        self._buffer = bytearray()  # written but not cut into segments yet
+        self._offset = 0  # stream offset of the first byte in _buffer
+        self._closing = False
+        self._timer_handle = None
+        self._timer_when = None
+        self._fin_seq = None
+        self._syn_acked = self.loop.create_future()
+        self._all_acked = self.loop.create_future()
+        self._fin_acked = self.loop.create_future()
+        self._drain_waiter = None
+        self._exception = None
+
+    def _open_window(self) -> None:
+        '''size the window and the congestion control in segments of the current MSS'''
+        max_window = max(1, self.max_win // self.mss)
+        self.cc = ptp_congestion.create(self.cc_name, max_window)
+        self.window = SendWindow(self.relative_0, max_window, self.rto, self.cc, self._transmit,
+                                 probe=self._window_probe)
+        if self.peer_window is not None:
+            self.window.on_window(0, self.peer_window)
+        self.high_water = 4 * max_window * self.mss
+
+    # asyncio.DatagramProtocol
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data, addr) -> None:
+        try:
+            version, type_no_int, flags, _, ack_no, advertised, _, conn_id = ptp_header.unpack(data)
+        except Exception:
+            return
+        if conn_id != self.conn_id and version >= 2:
+            return
+        if type_no_int == ptp_header.RESET:
+            self._abort(ConnectionResetError("the receiver reset the connection"))
+        elif type_no_int != ptp_header.ACK:
+            return
+        elif not self._syn_acked.done():
+            if ack_no == self.relative_0 and version in ptp_header.SUPPORTED_VERSIONS:
+                # the ACK of the SYN carries the header version and the MSS chosen by the receiver
+                self.header_version = version
+                options = ptp_header.unpack_options(memoryview(data)[ptp_header.header_size(version):])
+                self.mss = min(self.mss, ptp_header.mss_of(options))
+                self.window_scale = ptp_header.window_scale_of(options)
+                if self.window_scale is not None:
+                    self.peer_window = advertised << self.window_scale
+                self._open_window()
+                self._syn_acked.set_result(None)
+        elif self._fin_seq is not None and ack_no == (self._fin_seq + 1) % ptp_header.SEQ_MODULO:
+            if not self._fin_acked.done():
+                self._fin_acked.set_result(None)
+        else:
+            blocks = ptp_header.unpack_sack(data[ptp_header.header_size(version):]) \
+                if flags & ptp_header.FLAG_SACK else ()
+            advertised = advertised << self.window_scale if self.window_scale is not None else None
+            if self.window.on_ack(ack_no, blocks, time.time(), advertised):
+                self._pump()
+
+    def error_received(self, exc) -> None:
+        logging.debug(f"PTP sender socket error: {exc!r}")
+
+    def connection_lost(self, exc) -> None:
+        self._abort(exc or ConnectionAbortedError("the transport was closed"))
+
+    # sending
+
+    def _transmit(self, header, payload) -> None:
+        self.transport.sendto(header + payload)
+
+    def _window_probe(self) -> None:
+        '''an empty data segment at the next new byte, its ACK repeats the receiver's window'''
+        self.transport.sendto(ptp_header.pack_header(ptp_header.DATA, self.relative_0 + self._offset,
+                                                     conn_id=self.conn_id, version=self.header_version))
+
+    def _send_control(self, type_no: int, seq_no: int, payload=b"") -> None:
+        self.transport.sendto(ptp_header.pack(type_no, seq_no, payload=payload, conn_id=self.conn_id,
+                                              version=self.header_version))
+
+    def _pump(self) -> None:
+        '''retransmit what is due, cut new segments into the window and reschedule the timer'''
+        if self._exception is not None:
+            return
+        window = self.window
+        now = time.time()
+        window.on_timers(now)
+        buffer = self._buffer
+        mss = self.mss
+        while window.can_send(mss) and (len(buffer) >= mss or (self._closing and buffer)):
+            payload = bytes(buffer[:mss])
+            del buffer[:mss]
+            header = ptp_header.pack_header(ptp_header.DATA, self.relative_0 + self._offset, length=len(payload),
+                                            conn_id=self.conn_id, version=self.header_version)
+            self._offset += len(payload)
+            window.send_new(header, payload, self._offset, now)
+        if not len(window) and (len(buffer) >= mss or (self._closing and buffer)):
+            # the receiver's window is shut and no ACK is on its way to open it
+            window.persist(now)
+        if self._drain_waiter is not None and len(buffer) <= self.high_water:
+            if not self._drain_waiter.done():
+                self._drain_waiter.set_result(None)
+            self._drain_waiter = None
+        if self._closing and not buffer and not len(window) and not self._all_acked.done():
+            self._all_acked.set_result(None)
+        self._schedule(window.next_deadline())
+
+    def _schedule(self, deadline) -> None:
+        '''make sure _pump() runs again at deadline (a time.time() value), or never if it is None'''
+        if deadline is None:
+            return
+        if self._timer_handle is not None:
+            if self._timer_when <= deadline:
+                return
+            self._timer_handle.cancel()
+        self._timer_when = deadline
+        self._timer_handle = self.loop.call_later(max(0.0, deadline - time.time()), self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer_handle = None
+        self._pump()
+
+    def _abort(self, exc) -> None:
+        if self._exception is not None:
+            return
+        self._exception = exc
+        if self._timer_handle is not None:
+            self._timer_handle.cancel()
+        self.window.clear()
+        for future in (self._syn_acked, self._all_acked, self._fin_acked, self._drain_waiter):
+            if future is not None and not future.done():
+                future.set_exception(exc)
+                future.exception()  # retrieved here, so an unawaited future does not warn
+        if self.transport is not None:
+            self.transport.close()
+
+    # used by open_connection() and PTPStreamWriter
+
+    async def connect(self) -> None:
+        '''the SYN exchange, at most three SYNs like Sender.run()'''
+        options = ptp_header.pack_options({ptp_header.OPT_MSS: ptp_header.MSS_VALUE.pack(self.mss)})
+        for _ in range(3):
+            self._send_control(ptp_header.SYN, self.ISN, options)
+            try:
+                await asyncio.wait_for(asyncio.shield(self._syn_acked), self.rot)
+                return
+            except asyncio.TimeoutError:
+                continue
+        self._send_control(ptp_header.RESET, 0)
+        exc = ConnectionRefusedError("no ACK for the SYN after three attempts")
+        self._abort(exc)
+        raise exc
+
+    def write(self, data) -> None:
+        if self._exception is not None:
+            raise self._exception
+        if self._closing:
+            raise RuntimeError("write() after close()")
+        self._buffer += data
+        self._pump()
+
+    async def drain(self) -> None:
+        if self._exception is not None:
+            raise self._exception
+        if len(self._buffer) > self.high_water:
+            if self._drain_waiter is None:
+                self._drain_waiter = self.loop.create_future()
+            await asyncio.shield(self._drain_waiter)
+
+    def close(self) -> None:
+        if not self._closing:
+            self._closing = True
+            self._pump()
+
+    async def wait_closed(self) -> None:
+        '''wait until every byte is acknowledged, then exchange the FIN'''
+        try:
+            if self._exception is not None:
+                raise self._exception
+            await asyncio.shield(self._all_acked)
+            self._fin_seq = (self.relative_0 + self._offset + 1) % ptp_header.SEQ_MODULO
+            timeout = max(self.rot, self.rto.rto)
+            for attempt in range(3):
+                self._send_control(ptp_header.FIN, self._fin_seq)
+                try:
+                    await asyncio.wait_for(asyncio.shield(self._fin_acked), timeout * 2 ** attempt)
+                    break
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            if self._exception is None:
+                self._exception = ConnectionAbortedError("the connection is closed")
+                if self._timer_handle is not None:
+                    self._timer_handle.cancel()
+                self.transport.close()
+
+    def abort(self) -> None:
+        if self._exception is None and self.transport is not None:
+            self._send_control(ptp_header.RESET, 0)
+        self._abort(ConnectionAbortedError("the connection was aborted"))
+
+
+class PTPStreamWriter:
+    def __init__(self, protocol: _SenderProtocol) -> None:
+        '''
+        The sending end of a PTP connection, with the interface of asyncio.StreamWriter
+        '''
+        self._protocol = protocol
+
+    @property
+    def transport(self):
+        return self._protocol.transport
+
+    @property
+    def window(self) -> SendWindow:
+        '''the window of the connection, for its statistics'''
+        return self._protocol.window
+
+    def get_extra_info(self, name, default=None):
+        return self._protocol.transport.get_extra_info(name, default)
+
+    def write(self, data) -> None:
+        '''queue data, it is cut into segments as the window opens'''
+        self._protocol.write(data)
+
+    def writelines(self, data) -> None:
+        for chunk in data:
+            self._protocol.write(chunk)
+
+    async def drain(self) -> None:
+        '''wait until the data not yet handed to the window falls below the high-water mark'''
+        await self._protocol.drain()
+
+    def is_closing(self) -> bool:
+        return self._protocol._closing or self._protocol._exception is not None
+
+    def close(self) -> None:
+        '''send what is left; wait_closed() finishes with the FIN exchange'''
+        self._protocol.close()
+
+    async def wait_closed(self) -> None:
+        self._protocol.close()
+        await self._protocol.wait_closed()
+
+    def abort(self) -> None:
+        '''reset the connection at once, dropping the data in flight'''
+        self._protocol.abort()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            await self.wait_closed()
+        else:
+            self.abort()
+
+
+async def open_connection(host: str, port: int, *, local_addr=None, max_win: int = 64000, rot: int = 1000,
+                          cc: str = "reno", mss: int = ptp_header.DEFAULT_MSS) -> PTPStreamWriter:
+    '''
+    Connect to a PTP receiver
+    :param host: the address of the receiver
+    :param port: the UDP port of the receiver
+    :param local_addr: the (host, port) to send from, an ephemeral port by default
+    :param max_win: the maximum window size in bytes
+    :param rot: the initial retransmission timeout in milliseconds
+    :param cc: the congestion control algorithm, one of ptp_congestion.ALGORITHMS
+    :param mss: the largest payload in bytes offered in the SYN, the receiver may lower it
+    '''
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: _SenderProtocol(max_win, rot, cc, mss), local_addr=local_addr, remote_addr=(host, port))
+    try:
+        await protocol.connect()
+    except BaseException:
+        transport.close()
+        raise
+    return PTPStreamWriter(protocol)
+
+
+class _ReaderSink:
+    '''the file-like object a Reassembler writes the in-order data of a connection to'''
+
+    def __init__(self, reader: asyncio.StreamReader) -> None:
+        self.reader = reader
+
+    def write(self, data) -> None:
+        self.reader.feed_data(data)
+
+    def close(self) -> None:
+        self.reader.feed_eof()
+
+
+class _ServerFlow:
+    def __init__(self, sender_address: tuple, conn_id: int, header_version: int, relative_0: int, mss: int,
+                 receive_window: int, on_resume) -> None:
+        '''
+        The state of one server connection, and the transport its reader pauses and resumes
+        :param receive_window: the size of the ring buffer, the largest window advertised
+        :param on_resume: called with the flow when the reader wants data again
+        '''
+        self.sender_address = sender_address
+        self.conn_id = conn_id
+        self.header_version = header_version
+        self.relative_0 = relative_0
+        self.mss = mss
+        self.reader = asyncio.StreamReader()
+        self.reader.set_transport(self)
+        self.paused = False  # the reader holds enough, in-order data waits in the ring
+        self._on_resume = on_resume
+        self.reassembler = Reassembler(_ReaderSink(self.reader), relative_0, receive_window)
+        self.window_scale = max(0, receive_window.bit_length() - 16)  # so the window fits in 16 bits
+        self.advertised = receive_window  # the window in the last ACK, in bytes
+        self.finished = False
+        self.last_active = time.time()
+        self.task = None
+
+    def pause_reading(self) -> None:
+        self.paused = True
+
+    def resume_reading(self) -> None:
+        self.paused = False
+        self._on_resume(self)
+
+    def close(self, exc=None) -> None:
+        if not self.finished:
+            self.finished = True
+            if exc is not None:
+                self.reader.set_exception(exc)
+            else:
+                self.reassembler.close()
+
+
+class _ServerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client_connected_cb, idle_timeout: float, receive_window: int) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.client_connected_cb = client_connected_cb
+        self.idle_timeout = idle_timeout
+        self.receive_window = receive_window
+        self.transport = None
+        self.flows = dict()  # (sender address, connection ID) -> _ServerFlow
+        self._eviction_handle = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+        self._eviction_handle = self.loop.call_later(self.idle_timeout / 4, self._evict_idle)
+
+    def connection_lost(self, exc) -> None:
+        if self._eviction_handle is not None:
+            self._eviction_handle.cancel()
+        for flow in self.flows.values():
+            flow.close(ConnectionAbortedError("the server was closed"))
+            if flow.task is not None:
+                flow.task.cancel()
+        self.flows.clear()
+
+    def _reply(self, flow: _ServerFlow, ACK_seq_no: int, payload=b"", flags=0) -> None:
+        flow.advertised = flow.reassembler.window()
+        self.transport.sendto(ptp_header.pack(ptp_header.ACK, 0, ACK_seq_no, payload=payload,
+                                              window=flow.advertised >> flow.window_scale, flags=flags,
+                                              conn_id=flow.conn_id, version=flow.header_version),
+                              flow.sender_address)
+
+    def _ack(self, flow: _ServerFlow) -> None:
+        blocks = flow.reassembler.sack_blocks()
+        self._reply(flow, flow.reassembler.next_seq, ptp_header.pack_sack(blocks),
+                    ptp_header.FLAG_SACK if blocks else 0)
+
+    def _resume(self, flow: _ServerFlow) -> None:
+        # called from within a read of the application, the data is handed over on the next turn of the loop
+        self.loop.call_soon(self._hand_over, flow)
+
+    def _hand_over(self, flow: _ServerFlow) -> None:
+        '''give the reader the in-order data held back, and tell the sender when that opens its window'''
+        if flow.finished or flow.paused or self.transport is None or self.transport.is_closing():
+            return
+        flow.reassembler.flush()
+        window = flow.reassembler.window()
+        if window > flow.advertised and (flow.advertised < 2 * flow.mss
+                                         or window - flow.advertised >= flow.reassembler.capacity // 2):
+            self._ack(flow)
+
+    def datagram_received(self, data, addr) -> None:
+        try:
+            version, type_no_int, _, seq_no_int, _, _, _, conn_id = ptp_header.unpack(data)
+        except Exception:
+            return
+        key = (addr, conn_id)
+        flow = self.flows.get(key)
+
+        if type_no_int == ptp_header.SYN:
+            header_version = ptp_header.negotiate(version)
+            if header_version is None:
+                self.transport.sendto(ptp_header.pack(ptp_header.RESET, 0, version=1), addr)
+                return
+            ACK_seq_no = (seq_no_int + 1) % ptp_header.SEQ_MODULO
+            options = ptp_header.unpack_options(memoryview(data)[ptp_header.header_size(version):])
+            mss = min(ptp_header.mss_of(options), ptp_header.MAX_MSS)
+            if flow is None or flow.relative_0 != ACK_seq_no:
+                # a new transfer, not a retransmitted SYN
+                if flow is not None:
+                    flow.close(ConnectionResetError("the sender started a new transfer"))
+                flow = _ServerFlow(addr, conn_id, header_version, ACK_seq_no, mss, self.receive_window,
+                                   self._resume)
+                self.flows[key] = flow
+                result = self.client_connected_cb(flow.reader)
+                if asyncio.iscoroutine(result):
+                    flow.task = self.loop.create_task(result)
+            flow.last_active = time.time()
+            # the window keeps the sender from outrunning the ring
+            self._reply(flow, ACK_seq_no, ptp_header.pack_options({
+                ptp_header.OPT_MSS: ptp_header.MSS_VALUE.pack(flow.mss),
+                ptp_header.OPT_WSCALE: ptp_header.WSCALE_VALUE.pack(flow.window_scale)}))
+            return
+
+        if flow is None:
+            return
+        flow.last_active = time.time()
+        if type_no_int == ptp_header.DATA and not flow.finished:
+            flow.reassembler.offer(seq_no_int, memoryview(data)[ptp_header.header_size(version):])
+            if not flow.paused:
+                flow.reassembler.flush()  # the reader is the application's buffer
+            self._ack(flow)
+        elif type_no_int == ptp_header.PROBE:
+            self._reply(flow, len(data), flags=ptp_header.FLAG_PROBE)
+        elif type_no_int == ptp_header.FIN:
+            # the flow stays in the table until it idles out, so a retransmitted FIN is ACKed again
+            self._reply(flow, seq_no_int + 1)
+            flow.close()
+        elif type_no_int == ptp_header.RESET:
+            flow.close(ConnectionResetError("the sender reset the connection"))
+            del self.flows[key]
+
+    def _evict_idle(self) -> None:
+        now = time.time()
+        for key in [key for key, flow in self.flows.items() if now - flow.last_active > self.idle_timeout]:
+            self.flows.pop(key).close(TimeoutError(f"no segment for {self.idle_timeout}s"))
+        self._eviction_handle = self.loop.call_later(self.idle_timeout / 4, self._evict_idle)
+
+
+class PTPServer:
+    def __init__(self, transport, protocol: _ServerProtocol) -> None:
+        '''
+        A PTP receiver serving every connection on one UDP socket, see start_server()
+        '''
+        self.transport = transport
+        self._protocol = protocol
+        self._closed = asyncio.get_running_loop().create_future()
+        self.sockets = [transport.get_extra_info("socket")]
+
+    def close(self) -> None:
+        '''stop receiving, the readers of the unfinished connections get ConnectionAbortedError'''
+        self.transport.close()
+        if not self._closed.done():
+            self._closed.set_result(None)
+
+    async def wait_closed(self) -> None:
+        await self._closed
+
+    async def serve_forever(self) -> None:
+        try:
+            await self._closed
+        finally:
+            self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+        await self.wait_closed()
+
+
+async def start_server(client_connected_cb, host: str, port: int, *, idle_timeout: float = IDLE_TIMEOUT,
+                       receive_window: int = RECEIVE_WINDOW) -> PTPServer:
+    '''
+    Receive PTP connections on one UDP socket
+    :param client_connected_cb: called with an asyncio.StreamReader for every new connection,
+                                a coroutine function runs as its own task
+    :param host: the address to bind
+    :param port: the UDP port to bind, 0 for an ephemeral port
+    :param idle_timeout: seconds without a segment before a connection is evicted
+    :param receive_window: the receive buffer of every connection in bytes, the largest window advertised
+    '''
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: _ServerProtocol(client_connected_cb, idle_timeout, receive_window), local_addr=(host, port))
+    return PTPServer(transport, protocol)
@@ -0,0 +1,195 @@
+"""
+    Benchmark suite for PTP
+    Python 3
+    Usage: python3 ptp_bench.py [--quick] [--output bench_results.json] [--seed 1] [--repeat 10]
+    coding: utf-8
+
+    Notes:
+        Every run transfers a seeded random file from a Sender to a Receiver,
+        both in this process on ephemeral ports, through a LinkEmulator that
+        applies the loss rate in both directions plus the configured delay,
+        jitter, reordering, duplication and bandwidth limit. The matrix of file
+        sizes, windows and loss rates is run --repeat times, and for every cell
+        the results file records:
+            goodput_mbps          file bits per second of wall time (median of the completed
+                                  runs, null if none completed)
+            retransmission_ratio  retransmitted / original data segments (mean)
+            cpu_seconds           process CPU time of sender, receiver and link (median)
+            completion_p50/p99    wall time of a transfer, nearest-rank percentiles
+            host_dropped          datagrams the host dropped outside the emulated link
+                                  (full socket buffers), null where the kernel does not say;
+                                  a cell with any is not reproducible
+        With fewer than 100 runs per cell the nearest-rank p99 is simply the
+        slowest run, so the cell then says p99_is_max and the summary line
+        prints "max" instead of "p99".
+        The file is JSON, so two versions are compared by diffing their runs
+        of the same matrix with the same seed.
+"""
+import argparse
+import filecmp
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from ptp_emulator import Link, LinkEmulator
+import ptp_resume
+from receiver import Receiver
+from sender import Sender
+
+DEFAULT_SIZES = (100_000, 1_000_000, 4_000_000)
+DEFAULT_WINDOWS = (16_000, 64_000, 256_000)
+DEFAULT_LOSSES = (0.0, 0.01, 0.05)
+QUICK_SIZES = (100_000, 1_000_000)
+QUICK_WINDOWS = (64_000,)
+QUICK_LOSSES = (0.0, 0.02)
+
+
+def percentile(values: list, p: float) -> float:
+    '''the nearest-rank p-th percentile of values'''
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def run_once(source: str, window: int, loss: float, seed: int, args, workdir: str) -> dict:
+    '''transfer source once through a fresh emulated link and measure it'''
+    destination = os.path.join(workdir, "received.bin")
+    for stale in (destination, destination + ptp_resume.SUFFIX):
+        if os.path.exists(stale):
+            os.remove(stale)  # a failed run must not be resumed by the next one
+    receiver = Receiver(0, 0, destination, 0, 0)
+    receiver_thread = threading.Thread(target=receiver.run, daemon=True)
+    receiver_thread.start()
+
+    def link():
+        return Link(loss=loss, delay=args.delay, jitter=args.jitter, reorder=args.reorder,
+                    duplicate=args.duplicate, bandwidth=args.bandwidth, reorder_delay=args.reorder_delay)
+    emulator = LinkEmulator(receiver.receiver_socket.getsockname(), link(), link(), seed=seed)
+
+    cpu = time.process_time()
+    start = time.perf_counter()
+    sender = Sender(0, emulator.address[1], source, window, args.rot, args.cc, args.mss, compress=args.compress)
+    sender.run()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+
+    receiver_thread.join(1.0)  # the FIN may have been lost on the way
+    receiver.close()
+    receiver_thread.join()
+    emulator.close()
+
+    sent = max(1, sender.amount_of_data_segement_sent)
+    return {
+        "host_dropped": emulator.host_dropped,
+        # all the SYNs may be lost, the receiver then never creates the file
+        "completed": os.path.exists(destination) and filecmp.cmp(source, destination, shallow=False),
+        "seconds": elapsed,
+        "cpu_seconds": cpu,
+        "retransmission_ratio": sender.window.amount_of_resnd_data_segement / sent,
+    }
+
+
+def run_cell(source: str, size: int, window: int, loss: float, args, workdir: str) -> dict:
+    '''run one cell of the matrix args.repeat times and summarise it'''
+    runs = [run_once(source, window, loss, args.seed + n, args, workdir) for n in range(args.repeat)]
+    seconds = [run["seconds"] for run in runs]
+    completed = [run["seconds"] for run in runs if run["completed"]]
+    return {
+        "file_size": size,
+        "window": window,
+        "loss": loss,
+        "runs": len(runs),
+        "completed": sum(run["completed"] for run in runs),
+        "host_dropped": None if None in (run["host_dropped"] for run in runs)
+        else sum(run["host_dropped"] for run in runs),
+        "goodput_mbps": statistics.median(size * 8 / 1e6 / s for s in completed) if completed else None,
+        "retransmission_ratio": statistics.mean(run["retransmission_ratio"] for run in runs),
+        "cpu_seconds": statistics.median(run["cpu_seconds"] for run in runs),
+        "completion_p50": percentile(seconds, 50),
+        "completion_p99": percentile(seconds, 99),
+        "p99_is_max": len(seconds) < 100,
+        "samples": seconds,
+    }
+
+
+def git_revision() -> str:
+    '''the commit the benchmark runs on, or None outside a git checkout'''
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_list(kind):
+    return lambda text: tuple(kind(item) for item in text.split(","))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark PTP over an emulated lossy link")
+    parser.add_argument("--quick", action="store_true", help="a small matrix for a smoke test")
+    parser.add_argument("--sizes", type=parse_list(int), help="file sizes in bytes, comma separated")
+    parser.add_argument("--windows", type=parse_list(int), help="max_win values in bytes, comma separated")
+    parser.add_argument("--losses", type=parse_list(float), help="loss rates of both directions, comma separated")
+    parser.add_argument("--repeat", type=int, default=10, help="runs per cell")
+    parser.add_argument("--seed", type=int, default=1, help="seeds the files and the links")
+    parser.add_argument("--delay", type=float, default=0.002, help="one-way delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay of up to this many seconds")
+    parser.add_argument("--reorder", type=float, default=0.0, help="probability that a datagram is held back")
+    parser.add_argument("--reorder-delay", type=float, default=None,
+                        help="seconds a reordered datagram is held back, by default max(delay, jitter, 2 ms)")
+    parser.add_argument("--duplicate", type=float, default=0.0, help="probability that a datagram is duplicated")
+    parser.add_argument("--bandwidth", type=float, default=0.0, help="link rate in bits per second, 0 for none")
+    parser.add_argument("--rot", type=int, default=100, help="initial retransmission timeout in milliseconds")
+    parser.add_argument("--cc", default="reno", help="congestion control algorithm")
+    parser.add_argument("--mss", type=int, default=1000, help="segment size offered in the SYN")
+    parser.add_argument("--compress", default="none", help="compression offered in the SYN, e.g. zlib:1")
+    parser.add_argument("--output", default="bench_results.json", help="the JSON results file")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+    windows = args.windows or (QUICK_WINDOWS if args.quick else DEFAULT_WINDOWS)
+    losses = args.losses or (QUICK_LOSSES if args.quick else DEFAULT_LOSSES)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            source = os.path.join(workdir, f"source-{size}.bin")
+            with open(source, "wb") as file:
+                file.write(random.Random(args.seed).randbytes(size))
+            for window in windows:
+                for loss in losses:
+                    cell = run_cell(source, size, window, loss, args, workdir)
+                    results.append(cell)
+                    goodput = cell["goodput_mbps"]
+                    print(f"size {size:>9}  window {window:>7}  loss {loss:<5}  "
+                          f"goodput {'-' if goodput is None else format(goodput, '8.2f'):>8} Mbit/s  "
+                          f"retransmitted {cell['retransmission_ratio']:6.2%}  "
+                          f"cpu {cell['cpu_seconds']:6.3f} s  "
+                          f"p50 {cell['completion_p50']:6.3f} s  "
+                          f"{'max' if cell['p99_is_max'] else 'p99'} {cell['completion_p99']:6.3f} s  "
+                          f"completed {cell['completed']}/{cell['runs']}"
+                          + (f"  host dropped {cell['host_dropped']}" if cell["host_dropped"] else ""), flush=True)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+    Payload checksums and compression for PTP
+    Python 3
+    coding: utf-8
+
+    Notes:
+        An Encoder sits between the FileSegmenter and the socket of a Sender,
+        and a Decoder between the socket of a Receiver and its Reassembler.
+        What they do is negotiated in the SYN: the Sender offers OPT_CODEC
+        with a checksum flag, a compression method and its level, and the
+        receiver answers with what it accepts, the method lowered to
+        COMPRESS_NONE if it does not know it. A receiver that does not answer
+        OPT_CODEC gets plain segments, as before.
+
+        With the checksum on, the payload of every data segment starts with
+        the CRC-32 of the header and of the rest of the payload, and the
+        segment carries FLAG_CHECKSUM. A segment that fails the check is
+        dropped, so the sender retransmits it like a lost one.
+
+        Every segment is compressed on its own (raw deflate or raw LZMA2), since
+        segments are lost and reordered independently, and carries
+        FLAG_COMPRESSED when it is. Sequence numbers still count bytes of the
+        file. A segment that does not shrink goes out as it is; after
+        MAX_MISSES of those in a row the Encoder stops trying for BACKOFF
+        segments, so an incompressible file costs little CPU.
+"""
+import lzma
+import struct
+import zlib
+
+import ptp_header
+
+# compression methods
+COMPRESS_NONE = 0
+COMPRESS_ZLIB = 1
+COMPRESS_LZMA = 2
+
+METHODS = {"none": COMPRESS_NONE, "zlib": COMPRESS_ZLIB, "lzma": COMPRESS_LZMA}
+DEFAULT_LEVELS = {COMPRESS_NONE: 0, COMPRESS_ZLIB: 1, COMPRESS_LZMA: 0}
+MAX_LEVELS = {COMPRESS_NONE: 0, COMPRESS_ZLIB: 9, COMPRESS_LZMA: 9}
+
+CHECKSUM = struct.Struct("!I")
+MAX_MISSES = 8
+BACKOFF = 64
+
+
+def parse(spec) -> tuple:
+    '''
+    The compression asked for on the command line
+    :param spec: "none", "zlib", "lzma" or one of them with a level, e.g. "zlib:6"; None for "none"
+    :return: (method, level)
+    '''
+    name, _, level = (spec or "none").lower().partition(":")
+    if name not in METHODS:
+        raise ValueError(f"unknown compression {spec!r}, expected one of {', '.join(METHODS)}")
+    method = METHODS[name]
+    return method, max(0, min(int(level) if level else DEFAULT_LEVELS[method], MAX_LEVELS[method]))
+
+
+def accept(value):
+    '''
+    (Receiver side) the (checksum, method, level) to use for an OPT_CODEC offer, or None without one
+    '''
+    if value is None or len(value) != ptp_header.CODEC_VALUE.size:
+        return None
+    checksum, method, level = ptp_header.CODEC_VALUE.unpack(value)
+    if method not in MAX_LEVELS:
+        method, level = COMPRESS_NONE, 0
+    return bool(checksum), method, min(level, MAX_LEVELS[method])
+
+
+def _lzma_filters(level: int) -> list:
+    return [{"id": lzma.FILTER_LZMA2, "preset": level}]
+
+
+class Encoder:
+    def __init__(self, checksum: bool, method: int, level: int) -> None:
+        '''
+        :param checksum: prefix every payload with its CRC-32
+        :param method: one of COMPRESS_NONE, COMPRESS_ZLIB, COMPRESS_LZMA
+        :param level: the compression level of method
+        '''
+        self.checksum = checksum
+        self.method = method
+        self.level = level
+        self.raw_bytes = 0  # payload bytes handed in
+        self.wire_bytes = 0  # payload bytes put on the wire, checksums included
+        self.compressed = 0  # segments sent compressed
+        self._misses = 0
+        self._skip = 0
+
+    def _compress(self, payload) -> bytes:
+        if self.method == COMPRESS_ZLIB:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+            return compressor.compress(payload) + compressor.flush()
+        return lzma.compress(payload, format=lzma.FORMAT_RAW, filters=_lzma_filters(self.level))
+
+    def pack(self, seq_no: int, payload, conn_id: int, version: int) -> tuple:
+        '''
+        Encode a data segment
+        :return: the (header, payload) to send, the checksum is appended to the header
+        '''
+        flags = 0
+        self.raw_bytes += len(payload)
+        if self.method != COMPRESS_NONE and payload:
+            if self._skip:
+                self._skip -= 1
+            else:
+                compressed = self._compress(payload)
+                if len(compressed) < len(payload):
+                    payload = compressed
+                    flags |= ptp_header.FLAG_COMPRESSED
+                    self.compressed += 1
+                    self._misses = 0
+                else:
+                    self._misses += 1
+                    if self._misses >= MAX_MISSES:
+                        self._misses = 0
+                        self._skip = BACKOFF
+        if not self.checksum:
+            self.wire_bytes += len(payload)
+            return ptp_header.pack_header(ptp_header.DATA, seq_no, length=len(payload), flags=flags,
+                                          conn_id=conn_id, version=version), payload
+        header = ptp_header.pack_header(ptp_header.DATA, seq_no, length=CHECKSUM.size + len(payload),
+                                        flags=flags | ptp_header.FLAG_CHECKSUM, conn_id=conn_id, version=version)
+        self.wire_bytes += CHECKSUM.size + len(payload)
+        return header + CHECKSUM.pack(zlib.crc32(payload, zlib.crc32(header))), payload
+
+    def ratio(self) -> float:
+        '''bytes on the wire per byte of the file so far'''
+        return self.wire_bytes / self.raw_bytes if self.raw_bytes else 1.0
+
+
+class Decoder:
+    def __init__(self, checksum: bool, method: int, level: int, max_size: int) -> None:
+        '''
+        :param checksum: the segments must carry a valid CRC-32
+        :param method: the compression method negotiated
+        :param level: the compression level negotiated
+        :param max_size: the largest payload a segment may decompress to
+        '''
+        self.checksum = checksum
+        self.method = method
+        self.level = level
+        self.max_size = max_size
+
+    def _decompress(self, payload):
+        if self.method == COMPRESS_ZLIB:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        elif self.method == COMPRESS_LZMA:
+            decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=_lzma_filters(self.level))
+        else:
+            return None
+        try:
+            data = decompressor.decompress(payload, self.max_size)
+        except (zlib.error, lzma.LZMAError):
+            return None
+        return data if decompressor.eof else None
+
+    def unpack(self, segment, flags: int, header_size: int):
+        '''the payload of a data segment, or None if it is corrupt'''
+        view = memoryview(segment)
+        payload = view[header_size:]
+        if flags & ptp_header.FLAG_CHECKSUM:
+            if len(payload) < CHECKSUM.size:
+                return None
+            expected, = CHECKSUM.unpack_from(payload)
+            payload = payload[CHECKSUM.size:]
+            if zlib.crc32(payload, zlib.crc32(view[:header_size])) != expected:
+                return None
+        elif self.checksum:
+            return None  # the flag itself may have been corrupted
+        if flags & ptp_header.FLAG_COMPRESSED:
+            return self._decompress(payload)
+        return payload
@@ -0,0 +1,132 @@
+"""
+    Congestion control for the PTP Sender
+    Python 3
+    coding: utf-8
+
+    Notes:
+        The congestion window is counted in segments. The Sender calls on_ack()
+        for every segment an ACK delivers, on_loss() when three duplicate ACKs
+        trigger a fast retransmission and on_timeout() when the oldest segment
+        times out, and never has more than min(cwnd, max_win) segments in
+        flight. New algorithms are added to ALGORITHMS.
+"""
+import abc
+
+
+class CongestionControl(abc.ABC):
+    name = None
+
+    def __init__(self, max_window: int, initial_window: int = 10) -> None:
+        '''
+        :param max_window: the largest window in segments the sender may use, the cwnd never grows past it
+        :param initial_window: the cwnd in segments before the first ACK
+        '''
+        self.max_window = max(1, max_window)
+        self.cwnd = float(min(initial_window, self.max_window))
+        self.ssthresh = float(self.max_window)
+
+    @property
+    def window(self) -> int:
+        '''the number of segments that may be in flight'''
+        return max(1, int(self.cwnd))
+
+    @abc.abstractmethod
+    def on_ack(self, acked: int, now: float) -> None:
+        '''acked segments were delivered'''
+
+    @abc.abstractmethod
+    def on_loss(self, flight: int, now: float) -> None:
+        '''a segment was lost while flight segments were in flight and later ones still got through'''
+
+    def on_timeout(self, flight: int, now: float) -> None:
+        '''the oldest segment timed out while flight segments were in flight'''
+        self.ssthresh = max(flight / 2, 2.0)
+        self.cwnd = 1.0
+
+    def _grow(self, cwnd: float) -> None:
+        self.cwnd = min(cwnd, float(self.max_window))
+
+
+class Reno(CongestionControl):
+    '''slow start, then additive increase and multiplicative decrease'''
+    name = "reno"
+
+    def on_ack(self, acked: int, now: float) -> None:
+        if self.cwnd < self.ssthresh:
+            self._grow(self.cwnd + acked)
+        else:
+            self._grow(self.cwnd + acked / self.cwnd)
+
+    def on_loss(self, flight: int, now: float) -> None:
+        self.ssthresh = max(flight / 2, 2.0)
+        self.cwnd = self.ssthresh
+
+
+class Cubic(CongestionControl):
+    '''the cubic window growth of RFC 8312, with fast convergence and the TCP-friendly region'''
+    name = "cubic"
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self, max_window: int, initial_window: int = 10) -> None:
+        super().__init__(max_window, initial_window)
+        self.w_max = 0.0
+        self.epoch_start = None
+        self.k = 0.0
+        self.origin = 0.0
+        self.w_est = 0.0
+
+    def _reduce(self) -> None:
+        # fast convergence: give up some room when the flow backs off before reaching its last peak
+        if self.cwnd < self.w_max:
+            self.w_max = self.cwnd * (1 + self.BETA) / 2
+        else:
+            self.w_max = self.cwnd
+        self.ssthresh = max(self.cwnd * self.BETA, 2.0)
+        self.epoch_start = None
+
+    def on_ack(self, acked: int, now: float) -> None:
+        if self.cwnd < self.ssthresh:
+            self._grow(self.cwnd + acked)
+            return
+        if self.epoch_start is None:
+            self.epoch_start = now
+            if self.cwnd < self.w_max:
+                self.k = ((self.w_max - self.cwnd) / self.C) ** (1 / 3)
+                self.origin = self.w_max
+            else:
+                self.k = 0.0
+                self.origin = self.cwnd
+            self.w_est = self.cwnd
+        target = self.origin + self.C * (now - self.epoch_start - self.k) ** 3
+        self.w_est += acked * 3 * (1 - self.BETA) / (1 + self.BETA) / self.cwnd
+        if target > self.cwnd:
+            cwnd = self.cwnd + acked * (target - self.cwnd) / self.cwnd
+        else:
+            cwnd = self.cwnd + acked * 0.01 / self.cwnd
+        self._grow(max(cwnd, self.w_est))
+
+    def on_loss(self, flight: int, now: float) -> None:
+        self._reduce()
+        self.cwnd = self.ssthresh
+
+    def on_timeout(self, flight: int, now: float) -> None:
+        self._reduce()
+        self.cwnd = 1.0
+
+
+ALGORITHMS = {algorithm.name: algorithm for algorithm in (Reno, Cubic)}
+
+
+def create(name: str, max_window: int) -> CongestionControl:
+    '''
+    Instantiate a congestion control algorithm by name
+    :param name: a key of ALGORITHMS, e.g. "reno" or "cubic"
+    :param max_window: the largest window in segments the sender may use
+    '''
+    try:
+        algorithm = ALGORITHMS[name.lower()]
+    except KeyError:
+        raise ValueError(f"unknown congestion control algorithm {name!r}, "
+                         f"expected one of {sorted(ALGORITHMS)}") from None
+    return algorithm(max_window)
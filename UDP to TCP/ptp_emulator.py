@@ -0,0 +1,200 @@
+"""
+    Lossy link emulator for testing and benchmarking PTP
+    Python 3
+    coding: utf-8
+
+    Notes:
+        LinkEmulator is a UDP relay that sits between one sender and one
+        receiver. The sender sends to emulator.address instead of the
+        receiver, and every datagram crosses a Link in each direction that
+        may drop, delay, jitter, reorder, duplicate it and limit the
+        bandwidth. Each Link draws from its own random.Random seeded at
+        construction, so the same traffic meets the same fate on every run.
+        The relay sockets ask for large kernel buffers so a window of a few
+        hundred KB does not overflow them; the datagrams the host drops all
+        the same (a full receive or send buffer) are counted in host_dropped,
+        since they are outside the seeded Links and make a run unrepeatable.
+
+            emulator = LinkEmulator(receiver_address, Link(loss=0.01, delay=0.005), Link(), seed=1)
+            sender = Sender(0, emulator.address[1], filename, 64000, 100)
+            ...
+            emulator.close()
+"""
+import errno
+import heapq
+import itertools
+import random
+import selectors
+import socket
+import struct
+import sys
+import threading
+import time
+
+BUFFERSIZE = 65535
+SOCKET_BUFFER_SIZE = 1 << 22  # the kernel buffers asked for each relay socket
+# not exported by the socket module, the Linux option that reports how many datagrams a full receive buffer dropped
+_SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40 if sys.platform.startswith("linux") else None)
+_OVERFLOW = struct.Struct("I")
+MIN_REORDER_DELAY = 0.002  # the least hold-back of a reordered datagram, so reordering works without delay
+
+
+class Link:
+    def __init__(self, loss: float = 0.0, delay: float = 0.0, jitter: float = 0.0, reorder: float = 0.0,
+                 duplicate: float = 0.0, bandwidth: float = 0.0, queue_limit: int = 1 << 20,
+                 reorder_delay: float = None) -> None:
+        '''
+        One direction of the emulated path
+        :param loss: the probability that a datagram is dropped
+        :param delay: the one-way delay in seconds
+        :param jitter: a uniformly random extra delay of up to jitter seconds
+        :param reorder: the probability that a datagram is held back by reorder_delay, so later ones overtake it
+        :param duplicate: the probability that a datagram is delivered twice
+        :param bandwidth: the link rate in bits per second, 0 for unlimited
+        :param queue_limit: the most bytes waiting for the link before new datagrams are dropped (tail drop)
+        :param reorder_delay: how long a reordered datagram is held back, by default the larger of delay and
+            jitter but at least MIN_REORDER_DELAY
+        '''
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.reorder = reorder
+        self.duplicate = duplicate
+        self.bandwidth = bandwidth
+        self.queue_limit = queue_limit
+        if reorder_delay is None:
+            reorder_delay = max(delay, jitter, MIN_REORDER_DELAY)
+        self.reorder_delay = reorder_delay
+        self.random = random.Random()
+        self.busy_until = 0.0  # when the link has sent everything queued so far
+        self.dropped = 0
+        self.delivered = 0
+
+    def schedule(self, size: int, now: float) -> list:
+        '''the delivery times of a datagram of size bytes sent now, empty when it is lost'''
+        rand = self.random.random
+        if rand() < self.loss:
+            self.dropped += 1
+            return []
+        if self.bandwidth:
+            backlog = max(0.0, self.busy_until - now) * self.bandwidth / 8
+            if backlog + size > self.queue_limit:
+                self.dropped += 1
+                return []
+            self.busy_until = max(self.busy_until, now) + size * 8 / self.bandwidth
+            sent = self.busy_until
+        else:
+            sent = now
+        times = []
+        for _ in range(2 if rand() < self.duplicate else 1):
+            extra = self.reorder_delay if rand() < self.reorder else 0.0
+            times.append(sent + self.delay + self.jitter * rand() + extra)
+        self.delivered += len(times)
+        return times
+
+
+class LinkEmulator:
+    def __init__(self, receiver_address: tuple, forward: Link = None, reverse: Link = None, seed: int = 0,
+                 host: str = "127.0.0.1") -> None:
+        '''
+        Relay datagrams between a sender and receiver_address through two Links
+        :param receiver_address: where the datagrams of the sender go
+        :param forward: the Link from the sender to the receiver
+        :param reverse: the Link from the receiver back to the sender
+        :param seed: seeds both Links
+        :param host: the address the emulator binds, on ephemeral ports
+        '''
+        self.receiver_address = receiver_address
+        self.forward = forward or Link()
+        self.reverse = reverse or Link()
+        self.forward.random.seed(seed)
+        self.reverse.random.seed(seed + 1)
+        self.sender_address = None  # learnt from the first datagram
+        self.front = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # faces the sender
+        self.front.bind((host, 0))
+        self.back = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # faces the receiver
+        self.back.bind((host, 0))
+        self._overflows = dict()  # socket -> datagrams its full receive buffer dropped, None if not reported
+        self.send_dropped = 0  # datagrams a full send buffer refused
+        for sock in (self.front, self.back):
+            sock.setblocking(False)
+            for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER_SIZE)
+                except OSError:
+                    pass  # the kernel default then
+            self._overflows[sock] = None
+            if _SO_RXQ_OVFL is not None and hasattr(sock, "recvmsg"):
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, _SO_RXQ_OVFL, 1)
+                    self._overflows[sock] = 0
+                except OSError:
+                    pass
+        self.address = self.front.getsockname()
+        self._queue = []  # heap of (delivery time, tie breaker, socket, datagram, address)
+        self._counter = itertools.count()
+        self._is_active = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.front, selectors.EVENT_READ)
+            selector.register(self.back, selectors.EVENT_READ)
+            while self._is_active:
+                timeout = 0.05
+                if self._queue:
+                    timeout = min(timeout, max(0.0, self._queue[0][0] - time.time()))
+                for key, _ in selector.select(timeout):
+                    self._drain(key.fileobj)
+                now = time.time()
+                while self._queue and self._queue[0][0] <= now:
+                    _, _, sock, datagram, address = heapq.heappop(self._queue)
+                    try:
+                        sock.sendto(datagram, address)
+                    except OSError as error:
+                        if error.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                            self.send_dropped += 1
+                        # otherwise e.g. the peer is gone, a real link would not notice either
+        self.front.close()
+        self.back.close()
+
+    @property
+    def host_dropped(self) -> int:
+        '''the datagrams lost in the host rather than on a Link, None if the kernel does not report them'''
+        if None in self._overflows.values():
+            return None
+        return sum(self._overflows.values()) + self.send_dropped
+
+    def _receive(self, sock: socket.socket) -> tuple:
+        if self._overflows[sock] is None:
+            return sock.recvfrom(BUFFERSIZE)
+        datagram, ancillary, _, address = sock.recvmsg(BUFFERSIZE, socket.CMSG_SPACE(_OVERFLOW.size))
+        for level, kind, data in ancillary:
+            if level == socket.SOL_SOCKET and kind == _SO_RXQ_OVFL and len(data) >= _OVERFLOW.size:
+                self._overflows[sock] = _OVERFLOW.unpack_from(data)[0]  # a running total
+        return datagram, address
+
+    def _drain(self, sock: socket.socket) -> None:
+        while True:
+            try:
+                datagram, address = self._receive(sock)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue  # an ICMP error from an earlier send
+            now = time.time()
+            if sock is self.front:
+                self.sender_address = address
+                link, out, destination = self.forward, self.back, self.receiver_address
+            elif self.sender_address is not None:
+                link, out, destination = self.reverse, self.front, self.sender_address
+            else:
+                continue
+            for when in link.schedule(len(datagram), now):
+                heapq.heappush(self._queue, (when, next(self._counter), out, datagram, destination))
+
+    def close(self) -> None:
+        '''stop relaying, the datagrams still in flight are lost'''
+        self._is_active = False
+        self._thread.join()
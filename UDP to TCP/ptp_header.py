@@ -0,0 +1,225 @@
+"""
+    Binary PTP header codec shared by the Sender and the Receiver
+    Python 3
+    coding: utf-8
+
+    Notes:
+        Every segment starts with a fixed-width header. Version 1 is 14 bytes:
+
+            0       1       2               6              10      12      14
+            +-------+-------+---------------+---------------+-------+-------+
+            |ver|typ| flags |    seq_no     |    ack_no     |window |length |
+            +-------+-------+---------------+---------------+-------+-------+
+
+        Version 2 appends a 32-bit conn_id chosen by the sender, so one receiver
+        socket can tell apart several connections from the same address:
+
+            14              18
+            +---------------+
+            |    conn_id    |
+            +---------------+
+
+        The high nibble of the first byte is the header version and the low
+        nibble the segment type. The SYN carries the highest version the sender
+        speaks and the ACK of the SYN carries the version both sides will use.
+        A version only ever appends fields, so a header of an unknown newer
+        version is still parsed with the newest layout known here.
+
+        An ACK is cumulative: ack_no is the next byte the receiver expects. With
+        FLAG_SACK set, its payload lists up to MAX_SACK_BLOCKS (start, end)
+        sequence ranges the receiver holds beyond ack_no.
+
+        The payload of a SYN and of the ACK of the SYN is a list of options,
+        each a kind byte, a 16-bit length and that many value bytes; unknown
+        kinds are skipped. OPT_MSS offers the largest payload the sender wants
+        to send, and the ACK of the SYN answers with the largest one the
+        receiver accepts. A peer that sends no OPT_MSS is held to DEFAULT_MSS.
+        OPT_RANGE marks the connection as one stripe of a striped transfer: its
+        data belongs at the given offset of a file of the given size.
+        OPT_RESUME offers to resume a transfer (see ptp_resume.py): the SYN
+        carries the file size, chunk size and a fingerprint of the content,
+        and the ACK of the SYN repeats them followed by the bitmap of the
+        chunks the receiver already holds.
+        OPT_CODEC offers a checksum and a compression method for the data
+        segments (see ptp_codec.py), and the ACK of the SYN answers with what
+        the receiver accepts; a data segment says how it was encoded with
+        FLAG_CHECKSUM and FLAG_COMPRESSED.
+        OPT_WSCALE, sent by the receiver in the ACK of the SYN, turns on flow
+        control: from then on the window of every ACK is the number of bytes
+        beyond ack_no the receiver has room for, shifted right by the given
+        scale so it fits in 16 bits.
+
+        A PROBE is a padded datagram the sender uses to find the largest size
+        that gets through; the receiver answers with an ACK with FLAG_PROBE set
+        whose ack_no is the size of the datagram it received.
+"""
+import struct
+
+HEADER_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+
+# segment types
+DATA = 0
+ACK = 1
+SYN = 2
+FIN = 3
+RESET = 4
+PROBE = 5
+
+# flag bits
+FLAG_SACK = 0x01
+FLAG_PROBE = 0x02
+FLAG_CHECKSUM = 0x04
+FLAG_COMPRESSED = 0x08
+
+# option kinds
+OPT_MSS = 2
+OPT_RANGE = 3
+OPT_RESUME = 4
+OPT_CODEC = 5
+OPT_WSCALE = 6
+
+SEQ_MODULO = 2 ** 32
+_HALF = SEQ_MODULO // 2
+
+HEADER_V1 = struct.Struct("!BBIIHH")
+HEADER_V2 = struct.Struct("!BBIIHHI")
+HEADER_SIZE = HEADER_V2.size
+
+SACK_BLOCK = struct.Struct("!II")
+MAX_SACK_BLOCKS = 4
+
+OPTION = struct.Struct("!BH")
+MSS_VALUE = struct.Struct("!H")
+RANGE_VALUE = struct.Struct("!QQ")  # offset of the stripe, size of the whole file
+RESUME_VALUE = struct.Struct("!QI16s")  # file size, chunk size, fingerprint, then the bitmap in the ACK of the SYN
+CODEC_VALUE = struct.Struct("!BBB")  # checksum on or off, compression method, compression level
+WSCALE_VALUE = struct.Struct("!B")  # the shift of the advertised window
+MAX_DATAGRAM = 65507  # the largest UDP payload over IPv4
+MAX_MSS = MAX_DATAGRAM - HEADER_SIZE
+DEFAULT_MSS = 1000
+
+_pack_v1 = HEADER_V1.pack
+_pack_v2 = HEADER_V2.pack
+_unpack_v1 = HEADER_V1.unpack_from
+_unpack_v2 = HEADER_V2.unpack_from
+
+
+def header_size(version: int) -> int:
+    '''the size in bytes of the header of the given version, i.e. the offset of the payload'''
+    return HEADER_V1.size if version < 2 else HEADER_V2.size
+
+
+def is_complete(segment) -> bool:
+    '''whether segment is at least as long as the header of the version it announces, so unpack() can parse it'''
+    return len(segment) > 0 and len(segment) >= header_size(segment[0] >> 4)
+
+
+def pack_header(type_no: int, seq_no: int, ack_no: int = 0, length: int = 0, window: int = 0, flags: int = 0,
+                conn_id: int = 0, version: int = HEADER_VERSION) -> bytes:
+    '''
+    Build the header of a segment whose payload is sent separately
+    :param type_no: one of DATA, ACK, SYN, FIN, RESET
+    :param seq_no: the sequence number, reduced modulo 2**32
+    :param ack_no: the acknowledgement number, reduced modulo 2**32
+    :param length: the length of the payload in bytes
+    :param window: the advertised window
+    :param flags: the flag bits
+    :param conn_id: the connection ID, dropped by version 1 headers
+    :param version: the header version negotiated for the connection
+    '''
+    if version < 2:
+        return _pack_v1((version << 4) | type_no, flags, seq_no % SEQ_MODULO, ack_no % SEQ_MODULO, window, length)
+    return _pack_v2((version << 4) | type_no, flags, seq_no % SEQ_MODULO, ack_no % SEQ_MODULO, window, length,
+                    conn_id)
+
+
+def pack(type_no: int, seq_no: int, ack_no: int = 0, payload=b"", window: int = 0, flags: int = 0,
+         conn_id: int = 0, version: int = HEADER_VERSION) -> bytes:
+    '''Build a segment, the parameters are those of pack_header() with the payload in place of its length'''
+    return pack_header(type_no, seq_no, ack_no, len(payload), window, flags, conn_id, version) + payload
+
+
+def unpack(segment) -> tuple:
+    '''
+    Parse the header of a segment
+    :return: (version, type_no, flags, seq_no, ack_no, window, length, conn_id), conn_id is 0 for version 1
+    '''
+    version = segment[0] >> 4
+    if version < 2:
+        ver_type, flags, seq_no, ack_no, window, length = _unpack_v1(segment)
+        conn_id = 0
+    else:
+        ver_type, flags, seq_no, ack_no, window, length, conn_id = _unpack_v2(segment)
+    return version, ver_type & 0x0F, flags, seq_no, ack_no, window, length, conn_id
+
+
+def seq_of(segment) -> int:
+    '''the sequence number of a packed segment'''
+    return _unpack_v1(segment)[2]
+
+
+def seq_diff(a: int, b: int) -> int:
+    '''the signed distance from sequence number b to a, correct across a wraparound'''
+    return (a - b + _HALF) % SEQ_MODULO - _HALF
+
+
+def pack_sack(blocks) -> bytes:
+    '''the payload of an ACK carrying the given (start, end) sequence ranges'''
+    return b"".join(SACK_BLOCK.pack(start % SEQ_MODULO, end % SEQ_MODULO) for start, end in blocks[:MAX_SACK_BLOCKS])
+
+
+def unpack_sack(payload) -> list:
+    '''the (start, end) sequence ranges carried by the payload of an ACK'''
+    return list(SACK_BLOCK.iter_unpack(payload[:len(payload) - len(payload) % SACK_BLOCK.size]))
+
+
+def negotiate(offered: int):
+    '''the header version to use with a peer that offered the given version, or None if there is none'''
+    for version in sorted(SUPPORTED_VERSIONS, reverse=True):
+        if version <= offered:
+            return version
+    return None
+
+
+def pack_options(options: dict) -> bytes:
+    '''the payload of a SYN carrying the given {kind: value bytes} options'''
+    return b"".join(OPTION.pack(kind, len(value)) + value for kind, value in options.items())
+
+
+def unpack_options(payload) -> dict:
+    '''the {kind: value bytes} options carried by the payload of a SYN, a truncated option is dropped'''
+    options = dict()
+    offset = 0
+    while offset + OPTION.size <= len(payload):
+        kind, length = OPTION.unpack_from(payload, offset)
+        offset += OPTION.size
+        if offset + length > len(payload):
+            break
+        options[kind] = bytes(payload[offset:offset + length])
+        offset += length
+    return options
+
+
+def mss_of(options: dict) -> int:
+    '''the MSS offered by the given options, DEFAULT_MSS when there is none'''
+    value = options.get(OPT_MSS)
+    if value is None or len(value) != MSS_VALUE.size:
+        return DEFAULT_MSS
+    return max(1, min(MSS_VALUE.unpack(value)[0], MAX_MSS))
+
+
+def window_scale_of(options: dict):
+    '''the window scale advertised by the given options, or None if the peer advertises no window'''
+    value = options.get(OPT_WSCALE)
+    if value is None or len(value) != WSCALE_VALUE.size:
+        return None
+    return min(WSCALE_VALUE.unpack(value)[0], 16)
+
+
+def range_of(options: dict):
+    '''the (offset, file size) of a stripe offered by the given options, or None for a whole file'''
+    value = options.get(OPT_RANGE)
+    if value is None or len(value) != RANGE_VALUE.size:
+        return None
+    return RANGE_VALUE.unpack(value)
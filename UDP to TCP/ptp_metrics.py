@@ -0,0 +1,114 @@
+"""
+    Counters and histograms for PTP
+    Python 3
+    coding: utf-8
+
+    Notes:
+        A Metrics registry holds three kinds of instrument:
+            counter    a Counter the hot path increments
+            gauge      a function read only when the metrics are exported
+            histogram  a Histogram with fixed bucket bounds, observe() is one bisect
+        Asking for a name twice returns the same instrument, so a connection
+        that rebuilds its window keeps its numbers. snapshot() gives a dict
+        ready for json, and to_prometheus() the Prometheus text format.
+"""
+import bisect
+import json
+
+RTT_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)
+SEGMENT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+BYTE_BUCKETS = (1 << 10, 1 << 12, 1 << 14, 1 << 16, 1 << 18, 1 << 20, 1 << 22, 1 << 24)
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds) -> None:
+        '''
+        :param bounds: the ascending upper bounds of the buckets, a last +Inf bucket is added
+        '''
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self, prefix: str = "ptp") -> None:
+        '''
+        :param prefix: put in front of every exported name
+        '''
+        self.prefix = prefix
+        self._instruments = dict()  # name -> (kind, help, instrument)
+
+    def _get(self, name: str, kind: str, help_text: str, factory):
+        entry = self._instruments.get(name)
+        if entry is None:
+            entry = self._instruments[name] = (kind, help_text, factory())
+        return entry[2]
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get(name, "counter", help_text, Counter)
+
+    def gauge(self, name: str, help_text: str, read) -> None:
+        '''register a value read by calling read() at export time, replacing an older one'''
+        self._instruments[name] = ("gauge", help_text, read)
+
+    def histogram(self, name: str, help_text: str, bounds) -> Histogram:
+        return self._get(name, "histogram", help_text, lambda: Histogram(bounds))
+
+    def snapshot(self) -> dict:
+        '''every instrument as plain numbers, keyed by its full name'''
+        result = dict()
+        for name, (kind, _, instrument) in self._instruments.items():
+            full_name = f"{self.prefix}_{name}"
+            if kind == "counter":
+                result[full_name] = instrument.value
+            elif kind == "gauge":
+                result[full_name] = instrument()
+            else:
+                result[full_name] = {"buckets": dict(zip([*map(str, instrument.bounds), "+Inf"], instrument.counts)),
+                                     "sum": instrument.sum, "count": instrument.count}
+        return result
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, (kind, help_text, instrument) in self._instruments.items():
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            if kind == "counter":
+                lines.append(f"{full_name} {instrument.value}")
+            elif kind == "gauge":
+                lines.append(f"{full_name} {instrument()}")
+            else:
+                cumulative = 0
+                for bound, count in zip([*map(str, instrument.bounds), "+Inf"], instrument.counts):
+                    cumulative += count
+                    lines.append(f'{full_name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f"{full_name}_sum {instrument.sum}")
+                lines.append(f"{full_name}_count {instrument.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        '''export to path, as JSON if it ends with .json and in the Prometheus text format otherwise'''
+        with open(path, "w") as file:
+            file.write(self.to_json() if path.endswith(".json") else self.to_prometheus())
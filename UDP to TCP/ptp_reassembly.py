@@ -0,0 +1,122 @@
+"""
+    Out-of-order reassembly for the PTP Receiver
+    Python 3
+    coding: utf-8
+
+    Notes:
+        Sequence numbers are compared with serial-number arithmetic modulo 2**32,
+        so a transfer may wrap around. Every segment is copied into one ring
+        buffer allocated with the connection, at the position of its stream
+        offset, so receiving never allocates per segment; a short list of
+        ranges records what arrived beyond the first gap. flush() writes the
+        in-order data held in the ring to the file, and until it does that
+        data occupies the ring: window() is the room left, which the receiver
+        advertises so the sender never outruns a slow disk.
+"""
+import bisect
+
+from ptp_header import SEQ_MODULO, MAX_SACK_BLOCKS, seq_diff
+
+
+class Reassembler:
+    def __init__(self, file, next_seq: int, capacity: int = 1 << 20) -> None:
+        '''
+        :param file: the binary file object the in-order data is written to
+        :param next_seq: the sequence number of the first byte expected
+        :param capacity: the size of the ring buffer, the most bytes held in memory at once
+        '''
+        self.file = file
+        self.capacity = capacity
+        self._view = memoryview(bytearray(capacity))
+        self._seq_0 = next_seq % SEQ_MODULO  # the sequence number of stream offset 0
+        self._next = 0  # stream offset of the first byte not received
+        self.written = 0  # stream offset of the first byte not written to the file, i.e. the bytes written
+        self._ranges = []  # sorted, disjoint (start, end) stream offsets held beyond _next
+
+    @property
+    def next_seq(self) -> int:
+        '''the sequence number of the first byte not received, i.e. the cumulative ACK'''
+        return (self._seq_0 + self._next) % SEQ_MODULO
+
+    @property
+    def buffered(self) -> int:
+        '''the out-of-order bytes held'''
+        return sum(end - start for start, end in self._ranges)
+
+    @property
+    def unwritten(self) -> int:
+        '''the in-order bytes held that flush() would write'''
+        return self._next - self.written
+
+    def window(self) -> int:
+        '''the bytes beyond the cumulative ACK the ring still has room for'''
+        return self.capacity - (self._next - self.written)
+
+    def offer(self, seq_no: int, payload) -> bool:
+        '''
+        Take a segment
+        :return: False if it lies beyond the window and was dropped, True otherwise (duplicates included)
+        '''
+        start = self._next + seq_diff(seq_no, self.next_seq)
+        end = start + len(payload)
+        if end <= self._next:
+            return True  # everything in it was received already
+        if start < self._next:
+            payload = payload[self._next - start:]
+            start = self._next
+        if end > self.written + self.capacity:
+            return False
+        self._copy(start, payload)
+        if start == self._next:
+            self._next = end
+            # the ranges this segment made contiguous are in order now
+            ranges = self._ranges
+            while ranges and ranges[0][0] <= self._next:
+                self._next = max(self._next, ranges.pop(0)[1])
+        else:
+            self._add_range(start, end)
+        return True
+
+    def _copy(self, start: int, payload) -> None:
+        '''copy payload into the ring at stream offset start, wrapping at its end'''
+        index = start % self.capacity
+        first = min(len(payload), self.capacity - index)
+        self._view[index:index + first] = payload[:first]
+        if first < len(payload):
+            self._view[:len(payload) - first] = payload[first:]
+
+    def _add_range(self, start: int, end: int) -> None:
+        '''record that [start, end) is held, merged with the ranges it overlaps or touches'''
+        ranges = self._ranges
+        i = bisect.bisect_left(ranges, (start, end))
+        if i and ranges[i - 1][1] >= start:
+            i -= 1
+            start = ranges[i][0]
+        j = i
+        while j < len(ranges) and ranges[j][0] <= end:
+            end = max(end, ranges[j][1])
+            j += 1
+        ranges[i:j] = [(start, end)]
+
+    def flush(self) -> int:
+        '''write the in-order data held to the file, return the number of bytes written'''
+        count = self._next - self.written
+        if count:
+            index = self.written % self.capacity
+            first = min(count, self.capacity - index)
+            self.file.write(self._view[index:index + first])
+            if first < count:
+                self.file.write(self._view[:count - first])
+            self.written = self._next
+        return count
+
+    def sack_blocks(self, limit: int = MAX_SACK_BLOCKS) -> list:
+        '''the first (start, end) sequence ranges held beyond next_seq'''
+        return [((self._seq_0 + start) % SEQ_MODULO, (self._seq_0 + end) % SEQ_MODULO)
+                for start, end in self._ranges[:limit]]
+
+    def close(self) -> None:
+        '''write the in-order data, drop whatever is still out of order and close the file'''
+        self.flush()
+        self._ranges.clear()
+        self.file.close()
@@ -0,0 +1,219 @@
+"""
+    Resumable transfers for PTP
+    Python 3
+    coding: utf-8
+
+    Notes:
+        The receiver keeps a Progress file next to every file it receives,
+        FILE + SUFFIX, laid out so each update is written in place:
+
+            0          8           16          20          24            40
+            +----------+-----------+-----------+-----------+-------------+--------+--------------+
+            |  magic   | file size |chunk size |  chunks   | fingerprint | bitmap | chunk hashes |
+            +----------+-----------+-----------+-----------+-------------+--------+--------------+
+
+        The bitmap has a bit per chunk and each hash is the BLAKE2b-128 of a
+        chunk, set once the chunk is completely on disk. The data file is
+        flushed before its chunk is marked, so a receiver that dies leaves at
+        most unmarked chunks behind.
+
+        A Sender offers OPT_RESUME with its file size, chunk size and the
+        fingerprint() of the file in the SYN. If a Progress file with the same
+        sizes and fingerprint exists, the receiver re-hashes the chunks it
+        marks as done, clears those that no longer match and answers with the
+        bitmap; a different file of the same size has another fingerprint,
+        so it is received afresh instead of patched into the old one. Both
+        sides then derive the same missing_ranges(), and the data stream
+        carries just those ranges back to back. The Progress file is removed
+        once the transfer completes.
+"""
+import hashlib
+import os
+import struct
+
+CHUNK_SIZE = 1 << 20
+SUFFIX = ".ptp-resume"
+MAGIC = b"PTPRESU2"
+HEADER = struct.Struct("!8sQII16s")  # magic, file size, chunk size, number of chunks, fingerprint
+HASH_SIZE = 16
+
+
+def chunk_hash(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=HASH_SIZE).digest()
+
+
+def fingerprint(filename: str) -> bytes:
+    '''the BLAKE2b-128 of the whole content of filename, which a Progress must match to be resumed'''
+    hasher = hashlib.blake2b(digest_size=HASH_SIZE)
+    with open(filename, "rb") as file:
+        while data := file.read(CHUNK_SIZE):
+            hasher.update(data)
+    return hasher.digest()
+
+
+def chunk_count(size: int, chunk_size: int) -> int:
+    return -(-size // chunk_size)
+
+
+def missing_ranges(bitmap: bytes, size: int, chunk_size: int) -> list:
+    '''the (offset, length) runs of the chunks whose bit is clear, merged and in file order'''
+    ranges = []
+    for n in range(chunk_count(size, chunk_size)):
+        if bitmap[n >> 3] & (0x80 >> (n & 7)):
+            continue
+        offset = n * chunk_size
+        length = min(chunk_size, size - offset)
+        if ranges and ranges[-1][0] + ranges[-1][1] == offset:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+        else:
+            ranges.append((offset, length))
+    return ranges
+
+
+class Progress:
+    def __init__(self, path: str, size: int, chunk_size: int, digest: bytes, fresh: bool) -> None:
+        '''
+        Use open() or create() instead
+        :param path: the Progress file
+        :param size: the size of the file being received
+        :param chunk_size: the size of a chunk, the last one may be shorter
+        :param digest: the fingerprint of the file being received
+        :param fresh: start from an empty bitmap instead of reading path
+        '''
+        if chunk_size <= 0:
+            raise ValueError(f"chunk size must be positive, not {chunk_size}")
+        self.path = path
+        self.size = size
+        self.chunk_size = chunk_size
+        self.digest = digest
+        self.chunks = chunk_count(size, chunk_size)
+        self._bitmap_offset = HEADER.size
+        self._hash_offset = HEADER.size + (self.chunks + 7) // 8
+        if fresh:
+            self.bitmap = bytearray((self.chunks + 7) // 8)
+            self.hashes = bytearray(self.chunks * HASH_SIZE)
+            self._file = open(path, "w+b")
+            self._file.write(HEADER.pack(MAGIC, size, chunk_size, self.chunks, digest) + self.bitmap + self.hashes)
+            self._file.flush()
+        else:
+            self._file = open(path, "r+b")
+            data = self._file.read()
+            self.bitmap = bytearray(data[self._bitmap_offset:self._hash_offset])
+            self.hashes = bytearray(data[self._hash_offset:self._hash_offset + self.chunks * HASH_SIZE])
+
+    @classmethod
+    def create(cls, filename: str, size: int, chunk_size: int, digest: bytes):
+        '''a new Progress for filename, replacing any older one'''
+        return cls(filename + SUFFIX, size, chunk_size, digest, True)
+
+    @classmethod
+    def open(cls, filename: str, size: int, chunk_size: int, digest: bytes):
+        '''the Progress left behind for filename by an earlier transfer of the same file, or None'''
+        path = filename + SUFFIX
+        try:
+            with open(path, "rb") as file:
+                header = file.read(HEADER.size)
+            magic, old_size, old_chunk_size, chunks, old_digest = HEADER.unpack(header)
+        except (OSError, struct.error):
+            return None
+        if (magic != MAGIC or old_size != size or old_chunk_size != chunk_size or old_digest != digest
+                or not os.path.exists(filename)):
+            return None
+        return cls(path, size, chunk_size, digest, False)
+
+    def done(self, n: int) -> bool:
+        return bool(self.bitmap[n >> 3] & (0x80 >> (n & 7)))
+
+    def complete(self) -> bool:
+        return all(self.done(n) for n in range(self.chunks))
+
+    def mark(self, n: int, digest: bytes) -> None:
+        '''record that chunk n is on disk with the given hash'''
+        self.bitmap[n >> 3] |= 0x80 >> (n & 7)
+        self.hashes[n * HASH_SIZE:(n + 1) * HASH_SIZE] = digest
+        self._file.seek(self._hash_offset + n * HASH_SIZE)
+        self._file.write(digest)
+        self._file.seek(self._bitmap_offset + (n >> 3))
+        self._file.write(self.bitmap[n >> 3:(n >> 3) + 1])
+        self._file.flush()
+
+    def verify(self, filename: str) -> int:
+        '''clear the chunks of filename that no longer match their hash, return how many were cleared'''
+        cleared = 0
+        with open(filename, "rb") as file:
+            for n in range(self.chunks):
+                if not self.done(n):
+                    continue
+                file.seek(n * self.chunk_size)
+                data = file.read(min(self.chunk_size, self.size - n * self.chunk_size))
+                if chunk_hash(data) != self.hashes[n * HASH_SIZE:(n + 1) * HASH_SIZE]:
+                    self.bitmap[n >> 3] &= ~(0x80 >> (n & 7)) & 0xFF
+                    cleared += 1
+        if cleared:
+            self._file.seek(self._bitmap_offset)
+            self._file.write(self.bitmap)
+            self._file.flush()
+        return cleared
+
+    def close(self) -> None:
+        self._file.close()
+
+    def remove(self) -> None:
+        '''close and delete the Progress file, the transfer is complete'''
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class ResumableWriter:
+    '''
+    The file-like object a Reassembler writes a resumable transfer through: it places
+    the stream into the missing ranges of the file and marks every chunk it completes
+    '''
+
+    def __init__(self, file, progress: Progress, ranges: list) -> None:
+        '''
+        :param file: the data file, opened for writing without truncating what is already there
+        :param progress: the Progress of file
+        :param ranges: the (offset, length) runs the stream fills, in order
+        '''
+        self.file = file
+        self.progress = progress
+        self._ranges = list(ranges)
+        self._run = 0
+        self._left = self._ranges[0][1] if self._ranges else 0  # bytes left in the current run
+        self._position = self._ranges[0][0] if self._ranges else 0
+        self._hasher = hashlib.blake2b(digest_size=HASH_SIZE)
+        if self._ranges:
+            file.seek(self._position)
+
+    def write(self, data) -> None:
+        view = memoryview(data)
+        chunk_size = self.progress.chunk_size
+        while view and self._run < len(self._ranges):
+            # up to the end of the run or of the chunk, whichever comes first
+            chunk_end = (self._position // chunk_size + 1) * chunk_size
+            piece = view[:min(len(view), self._left, chunk_end - self._position)]
+            self.file.write(piece)
+            self._hasher.update(piece)
+            self._position += len(piece)
+            self._left -= len(piece)
+            view = view[len(piece):]
+            if self._position == chunk_end or self._position == self.progress.size:
+                self.file.flush()
+                self.progress.mark((self._position - 1) // chunk_size, self._hasher.digest())
+                self._hasher = hashlib.blake2b(digest_size=HASH_SIZE)
+            if self._left == 0:
+                self._run += 1
+                if self._run < len(self._ranges):
+                    self._position, self._left = self._ranges[self._run]
+                    self.file.seek(self._position)
+
+    def close(self) -> None:
+        self.file.close()
+        if self.progress.complete():
+            self.progress.remove()
+        else:
+            self.progress.close()
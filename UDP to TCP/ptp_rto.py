@@ -0,0 +1,52 @@
+"""
+    Adaptive retransmission timeout for the PTP Sender
+    Python 3
+    coding: utf-8
+
+    Notes:
+        SRTT/RTTVAR estimation as in RFC 6298. The caller applies Karn's rule by
+        only feeding samples of segments that were never retransmitted; each
+        timeout doubles the RTO until a fresh sample arrives. The RTO never
+        drops below MIN_RTO (200 ms, as Linux), since a timer tighter than the
+        delay jitter of a path fires spuriously and resets the congestion window.
+"""
+
+MIN_RTO = 0.2
+
+
+class RTOEstimator:
+    def __init__(self, initial_rto: float, min_rto: float = MIN_RTO, max_rto: float = 60.0,
+                 granularity: float = 0.001) -> None:
+        '''
+        :param initial_rto: the RTO in seconds before the first RTT sample, e.g. the rot argument of the Sender
+        :param min_rto: the lower clamp of the RTO in seconds
+        :param max_rto: the upper clamp of the RTO in seconds, backoff included
+        :param granularity: the clock granularity in seconds
+        '''
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.granularity = granularity
+        self.srtt = None
+        self.rttvar = None
+        self.rto = self._clamp(initial_rto)
+        self.samples = 0
+        self.backoffs = 0
+
+    def _clamp(self, rto: float) -> float:
+        return min(self.max_rto, max(self.min_rto, rto))
+
+    def sample(self, rtt: float) -> None:
+        '''feed the RTT of a segment that was transmitted exactly once'''
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = self._clamp(self.srtt + max(self.granularity, 4 * self.rttvar))
+        self.samples += 1
+
+    def backoff(self) -> None:
+        '''double the RTO after a retransmission timeout'''
+        self.rto = self._clamp(self.rto * 2)
+        self.backoffs += 1
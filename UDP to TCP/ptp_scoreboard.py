@@ -0,0 +1,100 @@
+"""
+    Send scoreboard for the PTP Sender
+    Python 3
+    coding: utf-8
+
+    Notes:
+        The segments in flight live in a ring buffer indexed by segment number,
+        so a cumulative ACK releases every segment it covers by advancing one
+        index, and a SACK block finds the segments it covers by a binary search
+        over their end offsets instead of scanning the window. Offsets are byte
+        offsets from the first data byte, so segments may have any size.
+"""
+
+
+class Scoreboard:
+    def __init__(self, capacity: int) -> None:
+        '''
+        :param capacity: the most segments in flight at once
+        '''
+        self.capacity = max(1, capacity)
+        self._slots = [None] * self.capacity  # [header, payload, end_offset, sacked] per segment in flight
+        self.una = 0  # index of the oldest segment that is not cumulatively acknowledged
+        self.next = 0  # index of the next new segment
+        self.acked_offset = 0  # every byte before this offset is acknowledged
+        self.end_offset = 0  # the offset after the newest segment, i.e. of the next new byte
+
+    def __len__(self) -> int:
+        '''the number of segments in flight, SACKed ones included'''
+        return self.next - self.una
+
+    def bytes_in_flight(self) -> int:
+        '''the bytes sent and not cumulatively acknowledged, SACKed ones included'''
+        if self.next == self.una:
+            return 0
+        return self._slots[(self.next - 1) % self.capacity][2] - self.acked_offset
+
+    def full(self) -> bool:
+        return self.next - self.una >= self.capacity
+
+    def add(self, header: bytes, payload, end_offset: int) -> int:
+        '''put a new segment in the ring and return its index'''
+        i = self.next
+        self._slots[i % self.capacity] = [header, payload, end_offset, False]
+        self.next += 1
+        self.end_offset = end_offset
+        return i
+
+    def get(self, i: int):
+        '''the [header, payload, end_offset, sacked] entry of segment i, or None once it is acknowledged'''
+        if self.una <= i < self.next:
+            return self._slots[i % self.capacity]
+        return None
+
+    def ack(self, offset: int) -> list:
+        '''
+        Apply a cumulative ACK
+        :param offset: the byte offset the receiver expects next
+        :return: the indices released by this ACK, empty for a duplicate ACK
+        '''
+        released = []
+        if offset <= self.acked_offset:
+            return released
+        self.acked_offset = offset
+        slots = self._slots
+        while self.una < self.next:
+            slot = self.una % self.capacity
+            if slots[slot][2] > offset:
+                break
+            slots[slot] = None
+            released.append(self.una)
+            self.una += 1
+        return released
+
+    def sack(self, start_offset: int, end_offset: int) -> list:
+        '''
+        Apply a SACK block
+        :return: the indices newly marked as received by this block
+        '''
+        sacked = []
+        slots, capacity = self._slots, self.capacity
+        # the first segment ending after start_offset, the end offsets grow with the index
+        low, high = self.una, self.next
+        while low < high:
+            middle = (low + high) // 2
+            if slots[middle % capacity][2] <= start_offset:
+                low = middle + 1
+            else:
+                high = middle
+        for i in range(low, self.next):
+            entry = slots[i % capacity]
+            if entry[2] > end_offset:
+                break
+            if not entry[3] and entry[2] - len(entry[1]) >= start_offset:
+                entry[3] = True
+                sacked.append(i)
+        return sacked
+
+    def clear(self) -> None:
+        self._slots = [None] * self.capacity
+        self.una = self.next
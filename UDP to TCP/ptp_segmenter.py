@@ -0,0 +1,83 @@
+"""
+    Streaming segmenter for the PTP Sender
+    Python 3
+    coding: utf-8
+
+    Notes:
+        The file is memory-mapped and cut into memoryview slices, so a payload
+        is never copied or decoded before it reaches the socket, and only the
+        pages of the segments in flight (plus the kernel read-ahead) stay
+        resident. The mapping is private and writable only so that ctypes can
+        point sendmmsg at it; nothing ever writes to it, so no page is copied.
+        Files that cannot be mapped (empty files, pipes) are read lazily chunk
+        by chunk instead. A segmenter may cover just some byte ranges of the
+        file, sent back to back: the stripe of a striped transfer or the
+        missing chunks of a resumed one.
+"""
+import mmap
+import os
+
+
+class FileSegmenter:
+    def __init__(self, filename: str, segment_size: int = 1000, offset: int = 0, length: int = None,
+                 ranges: list = None) -> None:
+        '''
+        :param filename: the file to send, opened in binary mode
+        :param segment_size: the maximum payload of a segment in bytes
+        :param offset: the first byte of the range to send
+        :param length: the size of the range to send, up to the end of the file by default
+        :param ranges: the (offset, length) ranges to send in place of offset and length
+        '''
+        self.segment_size = segment_size
+        self._file = open(filename, "rb")
+        file_size = os.fstat(self._file.fileno()).st_size
+        if ranges is None:
+            ranges = [(offset, file_size - offset if length is None else length)]
+        self.ranges = [(min(start, file_size), max(0, min(size, file_size - start))) for start, size in ranges]
+        self.size = sum(size for _, size in self.ranges)
+        self._map = None
+        self._view = None
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (ValueError, OSError):
+            pass
+        else:
+            if hasattr(self._map, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                self._map.madvise(mmap.MADV_SEQUENTIAL)
+            self._view = memoryview(self._map)
+
+    def __iter__(self):
+        '''yield (offset, payload) pairs, where offset is the byte offset of payload in the ranges sent so far'''
+        segment_size = self.segment_size
+        stream = 0
+        for start, size in self.ranges:
+            if self._view is not None:
+                view = self._view[start:start + size]
+                for offset in range(0, size, segment_size):
+                    yield stream + offset, view[offset:offset + segment_size]
+            else:
+                self._file.seek(start)
+                offset = 0
+                while offset < size:
+                    data = self._file.read(min(segment_size, size - offset))
+                    if not data:
+                        break
+                    yield stream + offset, memoryview(data)
+                    offset += len(data)
+            stream += size
+
+    def close(self) -> None:
+        '''unmap and close the file, the payloads handed out must have been dropped by now'''
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
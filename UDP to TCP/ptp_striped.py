@@ -0,0 +1,87 @@
+"""
+    Striped transfer: one file over several PTP connections at once
+    Python 3
+    Usage: python3 ptp_striped.py receiver_port FileToSend.txt max_win rot stripes [reno|cubic] [mss]
+    coding: utf-8
+
+    Notes:
+        The file is cut into `stripes` contiguous byte ranges and each range is
+        sent by its own Sender in its own worker process, so the per-packet
+        work of the stripes runs on as many cores and every stripe recovers
+        from its losses on its own. The SYN of a stripe carries its offset
+        and the size of the file, and the receiver writes every stripe into
+        one preallocated file:
+            python3 receiver.py 9000 10000 FileReceived.txt 0 0
+            python3 ptp_striped.py 9000 FileToSend.txt 256000 100 4
+        max_win is the window of each stripe.
+"""
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import ptp_header
+from sender import Sender
+
+
+def split(size: int, stripes: int, mss: int) -> list:
+    '''
+    Cut size bytes into at most stripes (offset, length) ranges of whole segments,
+    at least one even for an empty file
+    '''
+    segments = -(-size // mss)
+    per_stripe = max(1, -(-segments // max(1, stripes))) * mss
+    ranges = [(offset, min(per_stripe, size - offset)) for offset in range(0, size, per_stripe)]
+    return ranges or [(0, 0)]
+
+
+def _send_stripe(receiver_port: int, filename: str, max_win: int, rot: int, cc: str, mss: int, offset: int,
+                 length: int) -> dict:
+    '''(Runs in a worker process) send one range of the file from an ephemeral port'''
+    sender = Sender(0, receiver_port, filename, max_win, rot, cc, mss, offset=offset, length=length)
+    sender.run()
+    return {
+        "offset": offset,
+        "length": length,
+        "completed": sender.FIN_successful,
+        "segments": sender.amount_of_data_segement_sent,
+        "retransmitted": sender.window.amount_of_resnd_data_segement,
+        "dup_acks": sender.window.amount_of_dup_ack,
+    }
+
+
+def send_striped(receiver_port: int, filename: str, max_win: int, rot: int, stripes: int, cc: str = "reno",
+                 mss: int = ptp_header.DEFAULT_MSS) -> list:
+    '''
+    Send filename over stripes connections in parallel
+    :return: the summary of every stripe, in file order
+    '''
+    ranges = split(os.path.getsize(filename), int(stripes), int(mss))
+    with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        futures = [pool.submit(_send_stripe, int(receiver_port), filename, int(max_win), int(rot), cc, int(mss),
+                               offset, length)
+                   for offset, length in ranges]
+        return [future.result() for future in futures]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        filename="Sender_log.txt",
+        level=logging.DEBUG,
+        format='%(message)20s')
+
+    if len(sys.argv) not in (6, 7, 8):
+        print(
+            "\n===== Error usage, python3 ptp_striped.py receiver_port FileToSend.txt max_win rot stripes [reno|cubic] [mss] ======\n")
+        exit(0)
+
+    start = time.time()
+    results = send_striped(*sys.argv[1:])
+    elapsed = time.time() - start
+    size = os.path.getsize(sys.argv[2])
+    for result in results:
+        print(f"stripe at {result['offset']}: {result['length']} bytes, {result['segments']} segments, "
+              f"{result['retransmitted']} retransmitted, {'done' if result['completed'] else 'FAILED'}")
+    print(f"{size} bytes over {len(results)} stripes in {round(elapsed, 3)} s, "
+          f"{round(size * 8 / 1e6 / max(elapsed, 1e-9), 2)} Mbit/s")
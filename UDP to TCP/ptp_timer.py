@@ -0,0 +1,84 @@
+"""
+    Retransmission timer for the PTP Sender
+    Python 3
+    coding: utf-8
+
+    Notes:
+        Deadlines are kept in a min-heap keyed by segment index, so arming a
+        timer is O(log n), cancelling one is O(1) (lazy deletion) and finding
+        the earliest RTO never scans the window.
+"""
+import heapq
+import threading
+import time
+
+
+class RetransmitTimer:
+    def __init__(self) -> None:
+        '''
+        A deadline heap shared by the sending loop and the listening thread.
+        The condition doubles as the lock protecting the sender window, so an ACK
+        that frees window space can wake the sending loop with notify().
+        '''
+        self.cond = threading.Condition()
+        self._heap = []
+        self._deadlines = dict()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, key) -> bool:
+        return key in self._deadlines
+
+    def arm(self, key, deadline: float) -> None:
+        '''(Call with cond held) start or restart the timer of key'''
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        # drop the stale entries left behind by cancel() once they dominate the heap
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(d, k) for k, d in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def cancel(self, key) -> bool:
+        '''(Call with cond held) stop the timer of key, return False if it was not armed'''
+        return self._deadlines.pop(key, None) is not None
+
+    def next_deadline(self):
+        '''(Call with cond held) the earliest live deadline, or None when no timer is armed'''
+        heap = self._heap
+        while heap:
+            deadline, key = heap[0]
+            if self._deadlines.get(key) == deadline:
+                return deadline
+            heapq.heappop(heap)
+        return None
+
+    def pop_expired(self, now: float) -> list:
+        '''(Call with cond held) remove and return the keys whose deadline is not later than now'''
+        expired = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            deadline, key = heapq.heappop(heap)
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+                expired.append(key)
+        return expired
+
+    def clear(self) -> None:
+        '''(Call with cond held) stop every timer'''
+        self._heap = []
+        self._deadlines.clear()
+
+    def wait(self) -> None:
+        '''(Call with cond held) sleep until the earliest deadline passes or notify() is called'''
+        deadline = self.next_deadline()
+        if deadline is None:
+            self.cond.wait()
+        else:
+            timeout = deadline - time.time()
+            if timeout > 0:
+                self.cond.wait(timeout)
+
+    def notify(self) -> None:
+        '''(Call with cond held) wake the sending loop'''
+        self.cond.notify_all()
@@ -0,0 +1,133 @@
+"""
+    Binary packet tracer for PTP
+    Python 3
+    Usage: python3 ptp_trace.py trace.bin
+    coding: utf-8
+
+    Notes:
+        PacketTracer keeps the last capacity packet events as fixed-size binary
+        records in a preallocated ring, so recording one is a single
+        struct.pack_into and nothing is formatted until the trace is read.
+        Callers check tracer.enabled before recording, which makes a disabled
+        tracer cost one attribute lookup per packet; the ring is only
+        allocated the first time the tracer is enabled.
+
+        dump() writes the records oldest first after a small header, and
+        running this module on such a file prints one line per event in the
+        format of the old Sender_log.txt:
+
+            snd    12.34    DATA    1001    1000
+"""
+import itertools
+import signal
+import struct
+import sys
+import time
+
+# events
+SEND = 0
+RECEIVE = 1
+RETRANSMIT = 2
+DROP = 3
+
+EVENT_NAMES = {SEND: "snd", RECEIVE: "rcv", RETRANSMIT: "rtx", DROP: "drop"}
+TYPE_NAMES = {0: "DATA", 1: "ACK", 2: "SYN", 3: "FIN", 4: "RESET", 5: "PROBE"}
+
+RECORD = struct.Struct("<dBBxxIII")  # time, event, segment type, seq_no, ack_no, length
+FILE_HEADER = struct.Struct("<8sHHI")  # magic, format version, record size, record count
+MAGIC = b"PTPTRACE"
+
+
+class PacketTracer:
+    def __init__(self, capacity: int = 1 << 16, enabled: bool = False) -> None:
+        '''
+        :param capacity: the number of records kept, older ones are overwritten
+        :param enabled: start recording at once
+        '''
+        self.capacity = max(1, capacity)
+        self.enabled = False
+        self._buffer = None
+        self._sequence = itertools.count()
+        self._written = 0
+        if enabled:
+            self.enable()
+
+    def enable(self) -> None:
+        if self._buffer is None:
+            self._buffer = bytearray(self.capacity * RECORD.size)
+        self.enabled = True
+
+    def disable(self) -> None:
+        '''stop recording, the records so far are kept'''
+        self.enabled = False
+
+    def toggle(self, *_) -> None:
+        '''switch recording on or off, usable as a signal handler'''
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def record(self, event: int, type_no: int, seq_no: int, ack_no: int = 0, length: int = 0) -> None:
+        '''(Check enabled first) record one packet event'''
+        i = next(self._sequence)  # atomic, so the sending and listening threads never share a slot
+        RECORD.pack_into(self._buffer, (i % self.capacity) * RECORD.size, time.time(), event, type_no,
+                         seq_no, ack_no, length)
+        self._written = max(self._written, i + 1)
+
+    def __len__(self) -> int:
+        return min(self._written, self.capacity)
+
+    def records(self) -> list:
+        '''the (time, event, type_no, seq_no, ack_no, length) records kept, oldest first'''
+        if self._buffer is None:
+            return []
+        written = self._written
+        return [RECORD.unpack_from(self._buffer, (i % self.capacity) * RECORD.size)
+                for i in range(written - min(written, self.capacity), written)]
+
+    def dump(self, path: str) -> None:
+        '''write the records kept to a binary trace file'''
+        records = self.records()
+        with open(path, "wb") as file:
+            file.write(FILE_HEADER.pack(MAGIC, 1, RECORD.size, len(records)))
+            for record in records:
+                file.write(RECORD.pack(*record))
+
+
+def install_signal_toggle(tracer: PacketTracer) -> bool:
+    '''let SIGUSR1 switch tracer on and off, return False where there is no SIGUSR1'''
+    if not hasattr(signal, "SIGUSR1"):
+        return False
+    signal.signal(signal.SIGUSR1, tracer.toggle)
+    return True
+
+
+def load(path: str) -> list:
+    '''the records of a trace file written by PacketTracer.dump()'''
+    with open(path, "rb") as file:
+        data = file.read()
+    magic, _, size, count = FILE_HEADER.unpack_from(data)
+    if magic != MAGIC or size != RECORD.size:
+        raise ValueError(f"{path} is not a PTP trace file")
+    return [RECORD.unpack_from(data, FILE_HEADER.size + i * size) for i in range(count)]
+
+
+def format_records(records) -> str:
+    '''one line per record, with the time in milliseconds since the first record'''
+    if not records:
+        return ""
+    start = records[0][0]
+    lines = []
+    for when, event, type_no, seq_no, ack_no, length in records:
+        number = ack_no if type_no == 1 else seq_no
+        lines.append(f"{EVENT_NAMES.get(event, event)}    {round((when - start) * 1000, 2)}    "
+                     f"{TYPE_NAMES.get(type_no, type_no)}    {number}    {length}")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("\n===== Error usage, python3 ptp_trace.py trace.bin ======\n")
+        exit(0)
+    print(format_records(load(sys.argv[1])))
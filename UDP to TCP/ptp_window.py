@@ -0,0 +1,253 @@
+"""
+    Sending half of the PTP state machine, independent of how segments are sent
+    Python 3
+    coding: utf-8
+
+    Notes:
+        SendWindow owns the scoreboard, the retransmission timers, the RTO
+        estimator and the congestion controller, and decides which segment goes
+        out when. It never touches a socket: it hands (header, payload) pairs to
+        the send callback and leaves the waiting to its caller, so the threaded
+        Sender and the asyncio transport share it. It also feeds the RTT, window
+        and retransmission metrics, and the packet trace when it is enabled.
+
+        A receiver that advertises a window caps new data at send_limit, the
+        stream offset it has room up to. When that cap leaves no room and
+        nothing is in flight, no ACK is coming to reopen the window, so the
+        caller arms the persist timer with persist(); each time it expires the
+        probe callback sends a window probe, with exponential backoff, until
+        an ACK opens the window again.
+"""
+import heapq
+
+from ptp_header import ACK, DATA, seq_diff, seq_of
+from ptp_metrics import BYTE_BUCKETS, RTT_BUCKETS, SEGMENT_BUCKETS, Metrics
+from ptp_scoreboard import Scoreboard
+from ptp_timer import RetransmitTimer
+import ptp_trace
+
+PERSIST = -1  # the timer key of the persist timer, segment indices are never negative
+MAX_PERSIST = 60.0  # seconds, the longest wait between two window probes
+
+
+class SendWindow:
+    def __init__(self, relative_0: int, max_window: int, rto, cc, send, metrics: Metrics = None,
+                 tracer: ptp_trace.PacketTracer = None, probe=None) -> None:
+        '''
+        :param relative_0: the sequence number of the first data byte
+        :param max_window: the most segments in flight at once
+        :param rto: the RTOEstimator of the connection
+        :param cc: the CongestionControl of the connection
+        :param send: called with (header, payload) to put a segment on the wire
+        :param metrics: the registry to report to, a new one by default
+        :param tracer: the packet tracer to record to, a disabled one by default
+        :param probe: called without arguments to send a window probe when the persist timer expires
+        '''
+        self.relative_0 = relative_0
+        self.max_window = max_window
+        self.scoreboard = Scoreboard(max_window)
+        self.timer = RetransmitTimer()
+        self.rto = rto
+        self.cc = cc
+        self.send = send
+        self.probe = probe
+        self.send_limit = None  # the stream offset the receiver has room up to, None while it advertises no window
+        self._limit_offset = 0  # the ACK offset send_limit was taken from
+        self.persist_backoff = 0
+        self.amount_of_window_probes = 0
+        self.send_timers = dict()  # segment index -> time of the last transmission
+        self.retransmitted = set()  # indices of the segments in flight sent more than once (Karn's rule)
+        self.lost = []  # heap of the indices waiting for a retransmission
+        self.lost_set = set()
+        self.retransmit_budget = 0
+        self.dup_acks = 0
+        self.in_recovery = False
+        self.recovery_point = 0
+        self.amount_of_resnd_data_segement = 0
+        self.amount_of_dup_ack = 0
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.tracer = tracer if tracer is not None else ptp_trace.PacketTracer()
+        self._rtt = self.metrics.histogram("rtt_seconds", "RTT samples", RTT_BUCKETS)
+        self._occupancy = self.metrics.histogram("window_occupancy_segments", "segments in flight at each send",
+                                                 SEGMENT_BUCKETS)
+        self._in_flight = self.metrics.histogram("bytes_in_flight", "unacknowledged bytes at each send", BYTE_BUCKETS)
+        self._retransmits = self.metrics.counter("retransmits_total", "retransmitted data segments")
+        self._dup_acks = self.metrics.counter("dup_acks_total", "duplicate ACKs received")
+        self._window_probes = self.metrics.counter("window_probes_total", "probes of a shut receiver window")
+
+    def __len__(self) -> int:
+        '''the number of segments in flight'''
+        return len(self.scoreboard)
+
+    def can_send(self, size: int = 0) -> bool:
+        '''whether the window has room for a new segment of up to size bytes'''
+        if len(self.scoreboard) >= min(self.cc.window, self.max_window):
+            return False
+        return self.send_limit is None or self.scoreboard.end_offset + size <= self.send_limit
+
+    def on_window(self, offset: int, window: int) -> bool:
+        '''
+        Take the window a receiver advertised in an ACK of the given stream offset
+        :return: whether it made room for new data
+        '''
+        if offset < self._limit_offset:
+            return False  # an ACK overtaken by a newer one
+        self._limit_offset = offset
+        opened = self.send_limit is None or offset + window > self.send_limit
+        self.send_limit = offset + window
+        if opened and self.timer.cancel(PERSIST):
+            self.persist_backoff = 0
+        return opened
+
+    def persist(self, now: float) -> None:
+        '''
+        (Call when can_send() fails on the receiver's window with nothing in flight)
+        arm the persist timer, unless it is armed already
+        '''
+        if PERSIST not in self.timer:
+            self.timer.arm(PERSIST, now + min(self.rto.rto * 2 ** self.persist_backoff, MAX_PERSIST))
+
+    def send_new(self, header: bytes, payload, end_offset: int, now: float) -> int:
+        '''put a new segment in the window and send it, return its index'''
+        i = self.scoreboard.add(header, payload, end_offset)
+        self._send_segment(i, now)
+        return i
+
+    def _send_segment(self, i: int, now: float, retransmit: bool = False) -> None:
+        header, payload, end_offset, _ = self.scoreboard.get(i)
+        self.send(header, payload)
+        self.send_timers[i] = now
+        self.timer.arm(i, now + self.rto.rto)
+        self._occupancy.observe(len(self.scoreboard))
+        self._in_flight.observe(self.scoreboard.bytes_in_flight())
+        if retransmit:
+            self.retransmitted.add(i)
+            self.amount_of_resnd_data_segement += 1
+            self._retransmits.inc()
+        if self.tracer.enabled:
+            self.tracer.record(ptp_trace.RETRANSMIT if retransmit else ptp_trace.SEND, DATA, seq_of(header),
+                               0, len(payload))
+
+    def _mark_lost(self, i: int) -> None:
+        '''queue the segment i for retransmission'''
+        entry = self.scoreboard.get(i)
+        if entry is not None and not entry[3] and i not in self.lost_set:
+            self.timer.cancel(i)
+            self.lost_set.add(i)
+            heapq.heappush(self.lost, i)
+
+    def on_timers(self, now: float) -> None:
+        '''
+        Handle the retransmission timers that expired by now, then retransmit the queued
+        holes, oldest first, one per segment that left the network, so a timeout does not
+        turn into a retransmission storm
+        '''
+        scoreboard = self.scoreboard
+        expired = self.timer.pop_expired(now)
+        if PERSIST in expired:
+            expired.remove(PERSIST)
+            self.persist_backoff += 1
+            self.amount_of_window_probes += 1
+            self._window_probes.inc()
+            if self.probe is not None:
+                self.probe()
+        if scoreboard.una in expired:
+            # back off once per timeout of the oldest segment, not once per segment
+            self.rto.backoff()
+            self.cc.on_timeout(len(scoreboard), now)
+            self.retransmit_budget = max(self.retransmit_budget, self.cc.window)
+        for i in expired:
+            # SACKed segments have no timer, so only holes come back here
+            self._mark_lost(i)
+        while self.lost and (self.retransmit_budget > 0 or len(self.timer) == 0):
+            i = heapq.heappop(self.lost)
+            self.lost_set.discard(i)
+            entry = scoreboard.get(i)
+            if entry is None or entry[3]:
+                continue
+            self._send_segment(i, now, retransmit=True)
+            self.retransmit_budget = max(0, self.retransmit_budget - 1)
+
+    def next_deadline(self):
+        '''when on_timers() must run next, or None while nothing is in flight'''
+        if self.lost and (self.retransmit_budget > 0 or len(self.timer) == 0):
+            return 0.0
+        return self.timer.next_deadline()
+
+    def offset_of(self, seq_no: int) -> int:
+        '''the byte offset in the stream of a sequence number near the window'''
+        acked_offset = self.scoreboard.acked_offset
+        return acked_offset + seq_diff(seq_no, self.relative_0 + acked_offset)
+
+    def on_ack(self, ack_no: int, blocks, now: float, window: int = None) -> bool:
+        '''
+        Release every segment covered by the cumulative ACK and stop the timers of the
+        SACKed ones, so only real holes are retransmitted. Three duplicate ACKs queue
+        the oldest segment for a fast retransmission.
+        :param window: the bytes the receiver advertised room for beyond ack_no, None if it advertises none
+        :return: whether the caller has something new to send, i.e. must run on_timers() and fill the window
+        '''
+        # the RTT is sampled from the newest segment this ACK covers for the first time,
+        # unless it was retransmitted (Karn's rule) or only released because a
+        # retransmission filled the hole before it
+        if self.tracer.enabled:
+            self.tracer.record(ptp_trace.RECEIVE, ACK, 0, ack_no, len(blocks))
+        sample = None
+        delivered = 0
+        ack_offset = self.offset_of(ack_no)
+        opened = window is not None and self.on_window(ack_offset, window)
+        released = self.scoreboard.ack(ack_offset)
+        fills_hole = any(i in self.retransmitted for i in released)
+        for i in released:
+            sent = self.send_timers.pop(i, None)  # None if it was SACKed before
+            if sent is not None:
+                delivered += 1
+                if not fills_hole:
+                    sample = (i, sent)
+            self.retransmitted.discard(i)
+            self.timer.cancel(i)
+        for start, end in blocks:
+            for i in self.scoreboard.sack(self.offset_of(start), self.offset_of(end)):
+                sent = self.send_timers.pop(i, None)
+                if sent is not None:
+                    delivered += 1
+                    if i not in self.retransmitted and (sample is None or i > sample[0]):
+                        sample = (i, sent)
+                self.timer.cancel(i)
+        if sample is not None:
+            self.rto.sample(now - sample[1])
+            self._rtt.observe(now - sample[1])
+
+        if released:
+            self.dup_acks = 0
+            if self.in_recovery and self.scoreboard.una >= self.recovery_point:
+                self.in_recovery = False
+        elif len(self.scoreboard) and not opened:
+            # an ACK that only opens the window, or answers a window probe, is no duplicate
+            self.amount_of_dup_ack += 1
+            self._dup_acks.inc()
+            self.dup_acks += 1
+            if self.dup_acks == 3 and not self.in_recovery and len(self.scoreboard):
+                # fast retransmit, and shrink the window once per window of data
+                self.cc.on_loss(len(self.scoreboard), now)
+                self.in_recovery = True
+                self.recovery_point = self.scoreboard.next
+                self._mark_lost(self.scoreboard.una)
+                self.retransmit_budget += 1
+        if delivered and not self.in_recovery:
+            self.cc.on_ack(delivered, now)
+        if self.lost:
+            # each segment that left the network makes room for one retransmission
+            self.retransmit_budget += delivered
+        else:
+            self.retransmit_budget = 0
+        return bool(released or self.lost or opened)
+
+    def clear(self) -> None:
+        '''forget every segment in flight, e.g. once the connection is torn down'''
+        self.scoreboard.clear()
+        self.send_timers.clear()
+        self.retransmitted.clear()
+        self.lost = []
+        self.lost_set.clear()
+        self.timer.clear()
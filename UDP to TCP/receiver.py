@@ -9,17 +9,140 @@
             python3 receiver_template.py 9000 10000 FileReceived.txt 1 1
         Then run the sender:
             python3 sender_template.py 11000 9000 FileToReceived.txt 1000 1
+        To serve many senders at once, put {host}, {port} and/or {conn_id} in the
+        file name; every connection is then stored in its own file and the
+        receiver keeps running after a transfer ends:
+            python3 receiver.py 9000 10000 "received-{port}-{conn_id}.txt" 0 0
+        As for the sender, PTP_TRACE names a file for the binary packet trace,
+        SIGUSR1 switches tracing on and off, and PTP_METRICS names a file the
+        counters and histograms are exported to when the receiver stops.
+        The stripes of a striped transfer (see ptp_striped.py) arrive as
+        separate connections; they are written at their offsets into one
+        preallocated file, and a single-file receiver stops once every byte
+        of it has arrived, not when one stripe is reset.
+        Progress is saved next to every file received from a sender offering
+        to resume (FILE.ptp-resume, see ptp_resume.py), so a transfer that
+        fails can be restarted and only sends the chunks still missing.
+        Data segments are checked against the CRC-32 and decompressed as agreed
+        in the SYN (see ptp_codec.py); a corrupt one is dropped unACKed.
+        Every connection receives into a ring buffer allocated with it, and
+        every ACK advertises the room left there. In-order data is written to
+        the file once the socket has no more datagrams ready, or as soon as it
+        fills half the buffer, so a receiver that cannot keep up with its disk
+        shuts the window instead of dropping segments.
 
     Author: Rui Li (Tutor for COMP3331/9331)
 """
 # here are the libs you may find it useful:
 import datetime, time  # to calculate the time delta of packet transmission
 import logging, sys  # to write the log
+import os
 import socket  # Core lib, to send packet via UDP socket
+import selectors  # one socket serves every connection
 from threading import Thread  # (Optional)threading will make the timer easily implemented
 import random  # for flp and rlp function
+import ptp_header
+from ptp_reassembly import Reassembler
+import ptp_codec
+import ptp_resume
+from ptp_batchio import BatchSender, BatchReceiver
+from ptp_metrics import BYTE_BUCKETS, Metrics
+import ptp_trace
 
-BUFFERSIZE = 10000
+BUFFERSIZE = ptp_header.MAX_DATAGRAM  # room for a segment of any MSS
+SOCKET_BUFFER_SIZE = 1 << 22  # the kernel receive buffer asked for, so a window of large segments fits
+RECEIVE_BUFFER_SIZE = 1 << 20  # the ring buffer of a connection, bytes received but not yet written
+WINDOW_SCALE = max(0, RECEIVE_BUFFER_SIZE.bit_length() - 16)  # so the advertised window fits in 16 bits
+IDLE_TIMEOUT = 60  # seconds without a segment before a connection is evicted
+
+
+class StripedFile:
+    def __init__(self, filename: str, size: int) -> None:
+        '''
+        The output file of a striped transfer, shared by the connections carrying its
+        stripes. It is preallocated to its final size and each stripe is written at its
+        own offset with pwrite, so the stripes never wait for each other.
+        :param filename: the file to write
+        :param size: the size of the whole file
+        '''
+        self.filename = filename
+        self.size = size
+        self.received = 0  # bytes of the stripes that finished
+        self.fd = os.open(filename, os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        os.ftruncate(self.fd, size)
+        if size and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(self.fd, 0, size)
+            except OSError:
+                pass  # not supported by the file system, the writes allocate the blocks instead
+
+    def complete(self) -> bool:
+        return self.received >= self.size
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class _StripeWriter:
+    '''the file-like object a Reassembler writes one stripe of a StripedFile through'''
+
+    def __init__(self, striped: StripedFile, offset: int) -> None:
+        self.striped = striped
+        self.position = offset
+
+    def write(self, data) -> None:
+        view = memoryview(data)
+        while view:
+            if hasattr(os, "pwrite"):
+                written = os.pwrite(self.striped.fd, view, self.position)
+            else:
+                os.lseek(self.striped.fd, self.position, os.SEEK_SET)
+                written = os.write(self.striped.fd, view)
+            self.position += written
+            view = view[written:]
+
+    def close(self) -> None:
+        pass  # the StripedFile is closed once all of its stripes are in
+
+
+class Flow:
+    def __init__(self, sender_address: tuple, conn_id: int, header_version: int, relative_0: int,
+                 filename: str, mss: int = ptp_header.DEFAULT_MSS, file=None, striped: StripedFile = None) -> None:
+        '''
+        The state of one connection, from its SYN to its FIN or RESET
+        :param sender_address: the (host, port) the sender sends from
+        :param conn_id: the connection ID the sender put in its header
+        :param header_version: the header version negotiated in the SYN exchange
+        :param relative_0: the sequence number of the first data byte
+        :param filename: the file the data of this connection is stored in
+        :param mss: the segment size negotiated in the SYN exchange
+        :param file: the file-like object the data is written to, filename opened for writing by default
+        :param striped: the file this connection carries a stripe of, None for a file of its own
+        '''
+        self.sender_address = sender_address
+        self.conn_id = conn_id
+        self.header_version = header_version
+        self.relative_0 = relative_0
+        self.filename = filename
+        self.mss = mss
+        self.striped = striped
+        self.resume_reply = None  # the OPT_RESUME value of the ACK of the SYN, for a resumable transfer
+        self.codec = None  # the (checksum, method, level) agreed in the SYN, None for plain segments
+        self.decoder = None
+        self.advertised = RECEIVE_BUFFER_SIZE  # the window in the last ACK, in bytes
+        if file is None:
+            file = open(filename, 'wb')
+        self.reassembler = Reassembler(file, relative_0, RECEIVE_BUFFER_SIZE)
+        self.finished = False
+        self.last_active = time.time()
+
+    def close(self) -> None:
+        '''flush the data received so far and close the file'''
+        if not self.finished:
+            self.finished = True
+            self.reassembler.close()
 
 
 class Receiver:
@@ -28,7 +151,8 @@ class Receiver:
         The server will be able to receive the file from the sender via UDP
         :param receiver_port: the UDP port number to be used by the receiver to receive PTP segments from the sender.
         :param sender_port: the UDP port number to be used by the sender to send PTP segments to the receiver.
-        :param filename: the name of the text file into which the text sent by the sender should be stored
+        :param filename: the name of the text file into which the text sent by the sender should be stored, or a
+                         template with {host}, {port} and {conn_id} fields to serve many connections (see the notes).
         :param flp: forward loss probability, which is the probability that any segment in the forward direction (Data, FIN, SYN) is lost.
         :param rlp: reverse loss probability, which is the probability of a segment in the reverse direction (i.e., ACKs) being lost.
 
@@ -38,84 +162,300 @@ class Receiver:
         self.sender_port = int(sender_port)
         self.server_address = (self.address, self.receiver_port)
         self.filename = filename
-        self.flp = flp
-        self.rlp = rlp
-        self.relative_0 = 0
-        self.data_buffer = dict()
+        self.flp = float(flp)
+        self.rlp = float(rlp)
+        self.flows = dict()  # (sender address, connection ID) -> Flow
+        self.striped = dict()  # file name -> StripedFile of the striped transfers in progress
+        self._unwritten = set()  # the flows holding in-order data not written to their file yet
+        self.serve_forever = "{" in filename
+        self.idle_timeout = IDLE_TIMEOUT
+        self.max_mss = BUFFERSIZE - ptp_header.HEADER_SIZE
+        self._is_active = True
 
         # init the UDP socket
         # define socket for the server side and bind address
         logging.debug(f"The sender is using the address {self.server_address} to receive message!")
         self.receiver_socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
         self.receiver_socket.bind(self.server_address)
-        pass
+        try:
+            self.receiver_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        except OSError:
+            pass  # the kernel default then
+        self.receiver_socket.setblocking(False)
+        # every datagram ready on the socket is taken in one system call, and their ACKs leave in one
+        self.batch_receiver = BatchReceiver(self.receiver_socket, BUFFERSIZE)
+        self.batch_sender = BatchSender(self.receiver_socket)
+        self.tracer = ptp_trace.PacketTracer()
+        self.metrics = Metrics("ptp_receiver")
+        self._received = self.metrics.counter("datagrams_total", "datagrams received")
+        self._dropped = self.metrics.counter("dropped_total", "datagrams dropped by flp")
+        self._acks = self.metrics.counter("acks_total", "ACKs sent")
+        self._acks_dropped = self.metrics.counter("acks_dropped_total", "ACKs dropped by rlp")
+        self._corrupt = self.metrics.counter("corrupt_total", "data segments that failed the checksum or decompression")
+        self._beyond_buffer = self.metrics.counter("beyond_buffer_total", "segments too far ahead to buffer")
+        self._window_updates = self.metrics.counter("window_updates_total", "ACKs sent only to open the window")
+        self._buffered = self.metrics.histogram("buffered_bytes", "out-of-order bytes held at each data segment",
+                                                BYTE_BUCKETS)
+        self.metrics.gauge("connections", "connections in the table", lambda: len(self.flows))
+        self.metrics.gauge("packets_per_second", "datagrams received per second",
+                           self.batch_receiver.stats.packets_per_second)
+        self.metrics.gauge("receive_syscalls_per_mb", "receive system calls per MB received",
+                           self.batch_receiver.stats.syscalls_per_mb)
+        self.metrics.gauge("acks_dropped", "ACKs dropped for want of room in the send buffer",
+                           lambda: self.batch_sender.stats.dropped)
 
-    def run(self) -> None:
+    def _flow_filename(self, sender_address: tuple, conn_id: int) -> str:
+        if not self.serve_forever:
+            return self.filename
+        return self.filename.format(host=sender_address[0], port=sender_address[1], conn_id=conn_id)
+
+    def _resumable_writer(self, filename: str, size: int, chunk_size: int, digest: bytes) -> tuple:
         '''
-        This function contain the main logic of the receiver
+        Pick up the progress an earlier transfer of filename left behind, or start afresh
+        :return: the writer of the transfer, None for a plain one, and the OPT_RESUME value to answer the SYN
+            with, None to send everything
         '''
-        while True:
-            # try to receive any incoming message from the sender
-            incoming_message, sender_address = self.receiver_socket.recvfrom(BUFFERSIZE)
-
-            # randomly drop the packet
-            flp = int(float(self.flp) * 100)
-            if random.randint(1, 100) < flp:
-                logging.debug("drop the package!")
+        # so the bitmap fits in the ACK of the SYN next to the other options, which a sender reads whole
+        max_chunks = (self.max_mss // 2 - ptp_header.RESUME_VALUE.size) * 8
+        if not chunk_size or ptp_resume.chunk_count(size, chunk_size) > max_chunks:
+            logging.debug(f"not resuming {filename}: {size} bytes in chunks of {chunk_size} bytes")
+            return None, None
+        progress = ptp_resume.Progress.open(filename, size, chunk_size, digest)
+        if progress is None:
+            progress = ptp_resume.Progress.create(filename, size, chunk_size, digest)
+            ranges = [(0, size)]
+            return ptp_resume.ResumableWriter(open(filename, 'wb'), progress, ranges), None
+        cleared = progress.verify(filename)
+        ranges = ptp_resume.missing_ranges(progress.bitmap, size, chunk_size)
+        logging.debug(f"resuming {filename}: {sum(length for _, length in ranges)} of {size} bytes missing, "
+                      f"{cleared} chunks failed their hash")
+        reply = ptp_header.RESUME_VALUE.pack(size, chunk_size, digest) + bytes(progress.bitmap)
+        return ptp_resume.ResumableWriter(open(filename, 'r+b'), progress, ranges), reply
+
+    def _reply(self, flow: Flow, ACK_seq_no: int, payload=b"", flags=0) -> bool:
+        '''send an ACK to the sender of flow unless rlp drops it, return whether it was sent'''
+        if random.random() < self.rlp:
+            self._acks_dropped.inc()
+            if self.tracer.enabled:
+                self.tracer.record(ptp_trace.DROP, ptp_header.ACK, 0, ACK_seq_no, len(payload))
+            return False
+        flow.advertised = flow.reassembler.window()
+        header = ptp_header.pack_header(ptp_header.ACK, 0, ACK_seq_no, length=len(payload),
+                                        window=flow.advertised >> WINDOW_SCALE, flags=flags,
+                                        conn_id=flow.conn_id, version=flow.header_version)
+        self.batch_sender.queue(header, payload, flow.sender_address)
+        self._acks.inc()
+        if self.tracer.enabled:
+            self.tracer.record(ptp_trace.SEND, ptp_header.ACK, 0, ACK_seq_no, len(payload))
+        return True
+
+    def handle(self, incoming_message, sender_address: tuple) -> bool:
+        '''
+        Process one segment
+        :return: True when a single-file receiver is done and should stop
+        '''
+        version, type_no_int, flags, seq_no_int, _, _, length, conn_id = ptp_header.unpack(incoming_message)
+        if self.tracer.enabled:
+            self.tracer.record(ptp_trace.RECEIVE, type_no_int, seq_no_int, 0, length)
+        key = (sender_address, conn_id)
+        flow = self.flows.get(key)
+
+        if type_no_int == ptp_header.SYN:
+            logging.debug(f"client{sender_address} send a SYN! conn_id = {conn_id}")
+            # answer with the newest header version both sides speak
+            header_version = ptp_header.negotiate(version)
+            if header_version is None:
+                logging.debug(f"client{sender_address} offered an unsupported header version {version}!")
+                self.batch_sender.queue(ptp_header.pack_header(ptp_header.RESET, 0, version=1), b"", sender_address)
+                return False
+            ACK_seq_no = (seq_no_int + 1) % ptp_header.SEQ_MODULO
+            # and with the smaller of the offered MSS and the largest segment that fits the buffers
+            options = ptp_header.unpack_options(memoryview(incoming_message)[ptp_header.header_size(version):])
+            mss = min(ptp_header.mss_of(options), self.max_mss)
+            codec = ptp_codec.accept(options.get(ptp_header.OPT_CODEC))
+            if codec is not None and codec[0]:
+                mss = min(mss, self.max_mss - ptp_codec.CHECKSUM.size)  # the checksum comes on top of the MSS
+            if flow is None or flow.relative_0 != ACK_seq_no:
+                # a new transfer, not a retransmitted SYN
+                if flow is not None:
+                    flow.close()
+                filename = self._flow_filename(sender_address, conn_id)
+                stripe = ptp_header.range_of(options)
+                resume = options.get(ptp_header.OPT_RESUME)
+                if stripe is not None:
+                    offset, size = stripe
+                    striped = self.striped.get(filename)
+                    if striped is None or striped.size != size:
+                        striped = self.striped[filename] = StripedFile(filename, size)
+                    flow = Flow(sender_address, conn_id, header_version, ACK_seq_no, filename, mss,
+                                _StripeWriter(striped, offset), striped)
+                elif resume is not None and len(resume) == ptp_header.RESUME_VALUE.size:
+                    writer, resume_reply = self._resumable_writer(filename, *ptp_header.RESUME_VALUE.unpack(resume))
+                    flow = Flow(sender_address, conn_id, header_version, ACK_seq_no, filename, mss, writer)
+                    flow.resume_reply = resume_reply
+                else:
+                    flow = Flow(sender_address, conn_id, header_version, ACK_seq_no, filename, mss)
+                if codec is not None:
+                    flow.codec = codec
+                    flow.decoder = ptp_codec.Decoder(*codec, mss)
+                self.flows[key] = flow
+            flow.last_active = time.time()
+            reply = {ptp_header.OPT_MSS: ptp_header.MSS_VALUE.pack(mss),
+                     ptp_header.OPT_WSCALE: ptp_header.WSCALE_VALUE.pack(WINDOW_SCALE)}
+            if flow.resume_reply is not None:
+                reply[ptp_header.OPT_RESUME] = flow.resume_reply
+            if flow.codec is not None:
+                reply[ptp_header.OPT_CODEC] = ptp_header.CODEC_VALUE.pack(*flow.codec)
+            self._reply(flow, ACK_seq_no, ptp_header.pack_options(reply))
+            return False
+
+        if flow is None:
+            logging.debug(f"client{sender_address} sent a segment for the unknown connection {conn_id}!")
+            return False
+        flow.last_active = time.time()
+
+        if type_no_int == ptp_header.DATA and not flow.finished:
+            # save data into the buffer
+            # in-order data goes straight to the file, early data waits in the reassembler
+            if flow.decoder is None:
+                data = memoryview(incoming_message)[ptp_header.header_size(version):]
+            else:
+                data = flow.decoder.unpack(incoming_message, flags, ptp_header.header_size(version))
+                if data is None:
+                    # no ACK, the sender retransmits it as if it had been lost
+                    self._corrupt.inc()
+                    if self.tracer.enabled:
+                        self.tracer.record(ptp_trace.DROP, type_no_int, seq_no_int, 0, length)
+                    return False
+            if not flow.reassembler.offer(seq_no_int, data):
+                self._beyond_buffer.inc()
+            if flow.reassembler.unwritten:
+                self._unwritten.add(flow)
+            self._buffered.observe(flow.reassembler.buffered)
+
+            # reply a cumulative ACK, plus the ranges held beyond it
+            blocks = flow.reassembler.sack_blocks()
+            self._reply(flow, flow.reassembler.next_seq, ptp_header.pack_sack(blocks),
+                        ptp_header.FLAG_SACK if blocks else 0)
+
+        elif type_no_int == ptp_header.PROBE:
+            # tell the sender how large a datagram got through
+            self._reply(flow, len(incoming_message), flags=ptp_header.FLAG_PROBE)
+
+        elif type_no_int == ptp_header.FIN:
+            logging.debug(f"client{sender_address} send a FIN!")
+            # the flow stays in the table until it idles out, so a retransmitted FIN is ACKed again
+            if self._reply(flow, (seq_no_int + 1) % ptp_header.SEQ_MODULO):
+                if flow.finished:
+                    return False  # a retransmitted FIN
+                flow.close()
+                striped = flow.striped
+                if striped is not None:
+                    striped.received += flow.reassembler.written
+                    if not striped.complete():
+                        return False  # other stripes are still on their way
+                    striped.close()
+                    self.striped.pop(striped.filename, None)
+                return not self.serve_forever
+
+        elif type_no_int == ptp_header.RESET:
+            flow.close()
+            del self.flows[key]
+            if flow.striped is not None:
+                return False  # only this stripe gave up, the file is not complete without it
+            return not self.serve_forever
+        return False
+
+    def write_out(self, minimum: int = 1) -> None:
+        '''
+        Write the in-order data of every flow holding at least minimum bytes of it, and
+        tell the sender when that opens a window it may be waiting on
+        '''
+        for flow in list(self._unwritten):
+            if flow.finished:
+                self._unwritten.discard(flow)  # close() wrote it
+                continue
+            if flow.reassembler.unwritten < minimum:
                 continue
+            self._unwritten.discard(flow)
+            flow.reassembler.flush()
+            window = flow.reassembler.window()
+            if window > flow.advertised and (flow.advertised < 2 * flow.mss
+                                             or window - flow.advertised >= RECEIVE_BUFFER_SIZE // 2):
+                blocks = flow.reassembler.sack_blocks()
+                if self._reply(flow, flow.reassembler.next_seq, ptp_header.pack_sack(blocks),
+                               ptp_header.FLAG_SACK if blocks else 0):
+                    self._window_updates.inc()
+
+    def evict_idle(self, now: float) -> None:
+        '''tear down the connections that sent nothing for idle_timeout seconds'''
+        for key in [key for key, flow in self.flows.items() if now - flow.last_active > self.idle_timeout]:
+            logging.debug(f"client{key[0]} connection {key[1]} evicted after {self.idle_timeout}s idle")
+            self.flows.pop(key).close()
+
+    def close(self) -> None:
+        '''make run() return from another thread, e.g. when the FIN never arrives'''
+        if self._is_active:
+            self._is_active = False
+            try:
+                self.receiver_socket.sendto(b"", self.receiver_socket.getsockname())
+            except OSError:
+                pass  # run() already returned and closed the socket
 
-            type_no_int = int.from_bytes(incoming_message[0: 2], byteorder='big')
-
-            if type_no_int == 2:
-                logging.debug(f"client{sender_address} send a SYN!")
-                ISN = int(incoming_message[2:12].decode('utf-8'))
-                ACK_type_no = 1
-                ACK_seq_no = ISN + 1
-                self.relative_0 = ACK_seq_no
-                reply_message = ACK_type_no.to_bytes(2, "big") + bytes(str(ACK_seq_no), 'utf-8').zfill(10) + b""
-                rlp = int(float(self.rlp) * 100)
-                if random.randint(1, 100) < rlp:
-                    logging.debug(f"drop the ACK {ACK_seq_no}!")
-                    continue
-                self.receiver_socket.sendto(reply_message, sender_address)
-
-            elif type_no_int == 0:
-                # save data into the buffer
-                seq_no_int = int(incoming_message[2:12].decode('utf-8'))
-                logging.debug(f"client{sender_address} send a message: type_no = {type_no_int} sequence = {seq_no_int % 65536}"
-                              f" len = {len(incoming_message[12:].decode('utf-8'))}")
-                data = incoming_message[12:].decode('utf-8')
-                self.data_buffer[int((seq_no_int - self.relative_0)/1000)] = data
-
-                # reply the ACK
-                ACK_type_no = 1
-                ACK_seq_no = seq_no_int + len(incoming_message[12:].decode('utf-8'))
-                reply_message = ACK_type_no.to_bytes(2, "big") + bytes(str(ACK_seq_no), 'utf-8').zfill(10) + b""
-
-                rlp = int(float(self.rlp) * 100)
-                if random.randint(1, 100) < rlp:
-                    logging.debug(f"drop the ACK {ACK_seq_no}!")
-                    continue
-                self.receiver_socket.sendto(reply_message, sender_address)
-
-            elif type_no_int == 3:
-                logging.debug(f"client{sender_address} send a FIN!")
-                FIN = int(incoming_message[2:12].decode('utf-8'))
-                ACK_type_no = 1
-                ACK_seq_no = FIN + 1
-                self.relative_0 = ACK_seq_no
-                reply_message = ACK_type_no.to_bytes(2, "big") + bytes(str(ACK_seq_no), 'utf-8').zfill(10) + b""
-                rlp = int(float(self.rlp) * 100)
-                if random.randint(1, 100) < rlp:
-                    logging.debug(f"drop the ACK {ACK_seq_no}!")
-                    continue
-                self.receiver_socket.sendto(reply_message, sender_address)
-                with open(self.filename, 'w') as f:
-                    for i in range(len(self.data_buffer)):
-                        f.write(self.data_buffer[i])
-                break
-            elif type_no_int == 4:
-                break
+    def log_stats(self) -> None:
+        '''log the datagram and system call counters of the receiving socket'''
+        stats = self.batch_receiver.stats
+        logging.debug(f"received {stats.datagrams} datagrams, {round(stats.packets_per_second(), 2)} per second, "
+                      f"{round(stats.syscalls_per_mb(), 2)} receive system calls per MB, "
+                      f"{round(self.batch_sender.stats.syscalls_per_mb(), 2)} ACK system calls per MB of ACKs, "
+                      f"{self.batch_sender.stats.dropped} ACKs dropped")
+
+    def run(self) -> None:
+        '''
+        This function contain the main logic of the receiver
+        '''
+        next_eviction = time.time() + self.idle_timeout
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.receiver_socket, selectors.EVENT_READ)
+            while self._is_active:
+                events = selector.select(max(0.0, next_eviction - time.time()))
+                # drain every datagram that is ready before going back to select()
+                while events:
+                    # try to receive any incoming message from the sender
+                    batch = self.batch_receiver.drain()
+                    if not batch:
+                        break
+                    for incoming_message, sender_address in batch:
+                        if not ptp_header.is_complete(incoming_message):
+                            continue  # too short for its header, or the wake-up of close()
+                        self._received.inc()
+                        # randomly drop the packet
+                        if random.random() < self.flp:
+                            self._dropped.inc()
+                            if self.tracer.enabled:
+                                self.tracer.record(ptp_trace.DROP, incoming_message[0] & 0x0F,
+                                                   ptp_header.seq_of(incoming_message), 0, len(incoming_message))
+                            continue
+                        if self.handle(incoming_message, sender_address):
+                            self._is_active = False
+                            break
+                    self.write_out(RECEIVE_BUFFER_SIZE // 2)
+                    self.batch_sender.flush()
+                    if not self._is_active:
+                        break
+                # the socket is drained, now is the time for the disk
+                self.write_out()
+                self.batch_sender.flush()
+                now = time.time()
+                if now >= next_eviction:
+                    self.evict_idle(now)
+                    next_eviction = now + self.idle_timeout / 4
+        for flow in self.flows.values():
+            flow.close()
+        for striped in self.striped.values():
+            striped.close()
+        self.log_stats()
+        self.receiver_socket.close()
 
 
 if __name__ == '__main__':
@@ -133,5 +473,13 @@ if __name__ == '__main__':
         exit(0)
 
     receiver = Receiver(*sys.argv[1:])
+    trace_file = os.environ.get("PTP_TRACE")
+    if trace_file:
+        receiver.tracer.enable()
+    ptp_trace.install_signal_toggle(receiver.tracer)
     receiver.run()
+    if trace_file:
+        receiver.tracer.dump(trace_file)
+    if os.environ.get("PTP_METRICS"):
+        receiver.metrics.write(os.environ["PTP_METRICS"])
 
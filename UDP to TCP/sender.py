@@ -1,7 +1,7 @@
 """
     Sample code for Sender (multi-threading)
     Python 3
-    Usage: python3 sender.py receiver_port sender_port FileToSend.txt max_recv_win rto
+    Usage: python3 sender.py receiver_port sender_port FileToSend.txt max_recv_win rto [reno|cubic] [mss] [probe] [none|zlib|lzma[:level]]
     coding: utf-8
 
     Notes:
@@ -9,6 +9,24 @@
             python3 receiver_template.py 9000 10000 FileReceived.txt 1 1
         Then run the sender:
             python3 sender_template.py 11000 9000 FileToReceived.txt 1000 1
+        The segment size (MSS) is offered in the SYN and lowered to what the
+        receiver accepts; with "probe" the sender then looks for the largest
+        segment that actually gets through, e.g. 64 KB segments on loopback:
+            python3 sender.py 11000 9000 FileToSend.txt 4000000 100 cubic 65000 probe
+        Packets are traced into a binary ring buffer instead of being logged.
+        Set PTP_TRACE to a file name to trace from the start and dump the
+        trace there at the end (read it with python3 ptp_trace.py FILE);
+        SIGUSR1 switches tracing on and off while the sender runs. Set
+        PTP_METRICS to a file name to export the counters and histograms,
+        as JSON for a .json name and in the Prometheus text format otherwise.
+        The SYN offers to resume: if the receiver kept the progress of an
+        earlier, failed transfer of the file, only the missing chunks are sent.
+        Data segments carry a CRC-32 the receiver checks, and can be compressed
+        one by one (see ptp_codec.py); e.g. a text file with fast zlib:
+            python3 sender.py 11000 9000 random1.txt 64000 100 reno 1000 0 zlib:1
+        The receiver advertises the room left in its receive buffer with every
+        ACK, and the sender never sends beyond it; while that window is shut
+        the sender probes it from time to time instead of sending data.
 
     Author: Rui Li (Tutor for COMP3331/9331)
 """
@@ -16,200 +34,303 @@
 import threading
 import time  # to calculate the time delta of packet transmission
 import logging, sys  # to write the log
+import os
 import random
 import socket  # Core lib, to send packet via UDP socket
 from threading import Thread  # (Optional)threading will make the timer easily implemented
+from ptp_segmenter import FileSegmenter
+from ptp_window import SendWindow
+from ptp_batchio import BatchSender, BatchReceiver
+from ptp_rto import RTOEstimator
+from ptp_metrics import Metrics
+import ptp_codec
+import ptp_resume
+import ptp_trace
+import ptp_congestion
+import ptp_header
 
-BUFFERSIZE = 10000
+BUFFERSIZE = ptp_header.MAX_DATAGRAM  # room for any ACK, e.g. the ACK of the SYN with a large resume bitmap
+# not exported by the socket module, the Linux values to set the don't-fragment bit while probing
+_IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10 if sys.platform.startswith("linux") else None)
+_IP_PMTUDISC_DO = 2
 
 
 class Sender:
-    def __init__(self, sender_port: int, receiver_port: int, filename: str, max_win: int, rot: int) -> None:
+    def __init__(self, sender_port: int, receiver_port: int, filename: str, max_win: int, rot: int,
+                 cc: str = "reno", mss: int = ptp_header.DEFAULT_MSS, probe: bool = False, compress: str = None,
+                 offset: int = 0, length: int = None) -> None:
         '''
         The Sender will be able to connect the Receiver via UDP
         :param sender_port: the UDP port number to be used by the sender to send PTP segments to the receiver
         :param receiver_port: the UDP port number on which receiver is expecting to receive PTP segments from the sender
         :param filename: the name of the text file that must be transferred from sender to receiver using your reliable transport protocol.
         :param max_win: the maximum window size in bytes for the sender window.
-        :param rot: the value of the retransmission timer in milliseconds. This should be an unsigned integer.
+        :param rot: the initial value of the retransmission timer in milliseconds, later adapted to the measured RTT. This should be an unsigned integer.
+        :param cc: the congestion control algorithm, one of ptp_congestion.ALGORITHMS.
+        :param mss: the largest payload in bytes offered in the SYN, the receiver may lower it.
+        :param probe: after the SYN, look for the largest segment up to the MSS that reaches the receiver.
+        :param compress: the compression offered in the SYN, "none", "zlib" or "lzma" with an optional ":level".
+        :param offset: with length, send only this byte range of the file, as one stripe of ptp_striped.
+        :param length: the size of the range, None to send the whole file.
         '''
         self.sender_port = int(sender_port)
         self.receiver_port = int(receiver_port)
         self.sender_address = ("127.0.0.1", self.sender_port)
         self.receiver_address = ("127.0.0.1", self.receiver_port)
         self.filename = filename
-        self.sender_contents = []
         self.ISN = random.randint(0, 2**16-1)
+        self.conn_id = random.randint(0, 2**32-1)  # tells this connection apart at a receiver serving many
         self.SYN_successful = False
         self.FIN_successful = False
-        self.windows_number = int(int(max_win) / 1000)
+        self.max_win = int(max_win)
+        self.mss = max(1, min(int(mss), ptp_header.MAX_MSS))
+        self.probe = probe not in (False, "", "0", "false", "no")
+        self.cc_name = cc
+        self.compression = ptp_codec.parse(compress)
+        self.encoder = None  # the ptp_codec.Encoder the receiver agreed to, None for plain segments
+        self.window_scale = None  # the shift of the receiver's window, None if it advertises none
+        self.peer_window = None  # the window advertised in the ACK of the SYN, in bytes
+        self.offset = int(offset)
+        self.length = None if length is None else int(length)
+        self.ranges = None  # the ranges still missing at the receiver of a resumed transfer
+        self.resumed_bytes = 0
+        self.fingerprint = None  # of the file, offered with OPT_RESUME
         self.rot = int(rot) / 1000
-        self.send_win_buffer = dict()
-        self.send_timers = dict()
+        self.rto = RTOEstimator(self.rot)
         self.relative_0 = self.ISN + 1
-        self.contents_dict = dict()
-        self.last_data_len = 0
+        self.metrics = Metrics()
+        self.tracer = ptp_trace.PacketTracer()
+        self._open_window()
+        self.segmenter = None
         self.initial_time = 0
         self.FIN_seq = self.relative_0 + 1
         self.amount_of_original_data = 0
         self.amount_of_data_segement_sent = 0
-        self.amount_of_resnd_data_segement = 0
-        self.amount_of_ack = 0
+        self.header_version = ptp_header.HEADER_VERSION
 
         # init the UDP socket
         # logging.debug(f"The sender is using the address {self.sender_address}")
         self.sender_socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
         self.sender_socket.bind(self.sender_address)
+        # the segments of one pass over the window leave in one system call, and the ACKs come in the same way
+        self.batch_sender = BatchSender(self.sender_socket)
+        self.batch_receiver = BatchReceiver(self.sender_socket, BUFFERSIZE)
+        self.metrics.gauge("cwnd_segments", "congestion window", lambda: self.cc.cwnd)
+        self.metrics.gauge("srtt_seconds", "smoothed RTT", lambda: self.rto.srtt or 0.0)
+        self.metrics.gauge("rto_seconds", "retransmission timeout", lambda: self.rto.rto)
+        self.metrics.gauge("mss_bytes", "segment size", lambda: self.mss)
+        self.metrics.gauge("packets_per_second", "data packets sent per second",
+                           self.batch_sender.stats.packets_per_second)
+        self.metrics.gauge("send_syscalls_per_mb", "send system calls per MB sent", self.batch_sender.stats.syscalls_per_mb)
+        self.metrics.gauge("wire_bytes_per_file_byte", "payload bytes on the wire per byte of the file",
+                           lambda: self.encoder.ratio() if self.encoder is not None else 1.0)
 
         #  (Optional) start the listening sub-thread first
         self._is_active = True  # for the multi-threading
 
-        self.send_win_lock = threading.Lock()
-        self.send_timers_lock = threading.Lock()
+        self.SYN_event = threading.Event()
+        self.FIN_event = threading.Event()
+        self.probe_event = threading.Event()
+        self.probe_acked = 0
 
-        listen_thread = Thread(target=self.listen)
-        listen_thread.start()
+        self.listen_thread = Thread(target=self.listen)
+        self.listen_thread.start()
         # todo add codes here
 
+    def _open_window(self):
+        '''size the window and the congestion control in segments of the current MSS'''
+        self.windows_number = max(1, self.max_win // self.mss)
+        self.cc = ptp_congestion.create(self.cc_name, self.windows_number)
+        # the window decides what to send when; its timer's condition guards it, so an ACK can wake ptp_send
+        self.window = SendWindow(self.relative_0, self.windows_number, self.rto, self.cc, self._transmit,
+                                 self.metrics, self.tracer, self._window_probe)
+        if self.peer_window is not None:
+            self.window.on_window(0, self.peer_window)
+
+    def _trace(self, event, type_no, seq_no, ack_no=0, length=0):
+        '''record a control segment, data segments and their ACKs are traced by the window'''
+        if self.tracer.enabled:
+            self.tracer.record(event, type_no, seq_no, ack_no, length)
+
+    def _probe_mss(self):
+        '''
+        Send padded PROBE datagrams, halving the size from the negotiated MSS down to
+        DEFAULT_MSS, and keep the first size the receiver acknowledges
+        '''
+        if self.mss <= ptp_header.DEFAULT_MSS:
+            return
+        header_size = ptp_header.header_size(self.header_version)
+        # a probe is as large as a data segment of its size, checksum included
+        overhead = ptp_codec.CHECKSUM.size if self.encoder is not None and self.encoder.checksum else 0
+        previous = None
+        if _IP_MTU_DISCOVER is not None:
+            try:
+                # never let the kernel fragment a probe, an oversized one fails with EMSGSIZE instead
+                previous = self.sender_socket.getsockopt(socket.IPPROTO_IP, _IP_MTU_DISCOVER)
+                self.sender_socket.setsockopt(socket.IPPROTO_IP, _IP_MTU_DISCOVER, _IP_PMTUDISC_DO)
+            except OSError:
+                previous = None
+        try:
+            size = self.mss
+            while size > ptp_header.DEFAULT_MSS:
+                probe = ptp_header.pack(ptp_header.PROBE, self.relative_0, payload=bytes(size + overhead),
+                                        conn_id=self.conn_id, version=self.header_version)
+                for _ in range(3):
+                    self.probe_event.clear()
+                    try:
+                        self.sender_socket.sendto(probe, self.receiver_address)
+                    except OSError:
+                        break  # larger than the path MTU
+                    self._trace(ptp_trace.SEND, ptp_header.PROBE, self.relative_0, 0, size)
+                    if self.probe_event.wait(self.rto.rto) and self.probe_acked == size + overhead + header_size:
+                        self.mss = size
+                        return
+                size = max(ptp_header.DEFAULT_MSS, size // 2)
+            self.mss = ptp_header.DEFAULT_MSS
+        finally:
+            if previous is not None:
+                self.sender_socket.setsockopt(socket.IPPROTO_IP, _IP_MTU_DISCOVER, previous)
+
+    def _resume(self, value):
+        '''take the bitmap the receiver answered OPT_RESUME with, and send only the chunks it lacks'''
+        if value is None or len(value) < ptp_header.RESUME_VALUE.size or self.length is not None:
+            return
+        size, chunk_size, digest = ptp_header.RESUME_VALUE.unpack_from(value)
+        bitmap = value[ptp_header.RESUME_VALUE.size:]
+        if (size != os.path.getsize(self.filename) or digest != self.fingerprint or not chunk_size
+                or len(bitmap) < (ptp_resume.chunk_count(size, chunk_size) + 7) // 8):
+            return
+        self.ranges = ptp_resume.missing_ranges(bitmap, size, chunk_size)
+        self.resumed_bytes = size - sum(length for _, length in self.ranges)
+
     def ptp_open(self):
         # todo add/modify codes here
         # send a greeting message to receiver
         # message = "Greetings! COMP3331."
         # self.sender_socket.sendto(message.encode("utf-8"), self.receiver_address)
-        type_no = 0
-        seq_no = self.ISN + 1
-        with open(self.filename, "rb") as file:
-            while True:
-                data = file.read(1000)
-                if data:
-                    content = type_no.to_bytes(2, "big") + bytes(str(seq_no), "utf-8").zfill(10) + data
-                    self.sender_contents.append(content)
-                    seq_no += 1000
-                    self.FIN_seq += len(content[12:].decode('utf-8'))
-                else:
-                    break
-                self.FIN_seq = self.FIN_seq % 65536
-
-        self.last_data_len = len(self.sender_contents[-1][12:].decode('utf-8'))
-        i = 0
-        for send_content in self.sender_contents:
-            self.contents_dict[i] = send_content
-            i += 1
+        # the file is segmented lazily while the window slides, see ptp_send
+        self.segmenter = FileSegmenter(self.filename, self.mss, self.offset, self.length, self.ranges)
+        self._segments = iter(self.segmenter)
 
-    def ptp_send(self):
-        # todo add codes here
-        for i in range(int(self.windows_number)):
-            self.sender_socket.sendto(self.contents_dict[i], self.receiver_address)
-            self.send_win_buffer[i] = self.contents_dict[i]
-            seq_no = int(self.contents_dict[i][2:12].decode('utf-8'))
-            data_len = len(self.contents_dict[i][12:])
-            self.amount_of_original_data += data_len
-            start_time = time.time()
-            self.send_timers[i] = start_time
-            logging.debug(f"snd    {round((start_time - self.initial_time)*1000, 2)}    DATA    {seq_no}    {data_len}")
+    def _next_segment(self):
+        '''(Call with the window lock held) cut the next segment from the file and send it, return False at EOF'''
+        try:
+            offset, payload = next(self._segments)
+        except StopIteration:
+            return False
+        length = len(payload)
+        if self.encoder is None:
+            header = ptp_header.pack_header(ptp_header.DATA, self.relative_0 + offset, length=length,
+                                            conn_id=self.conn_id, version=self.header_version)
+        else:
+            header, payload = self.encoder.pack(self.relative_0 + offset, payload, self.conn_id, self.header_version)
+        self.amount_of_data_segement_sent += 1
+        self.amount_of_original_data += length
+        self.FIN_seq = (self.FIN_seq + length) % ptp_header.SEQ_MODULO
+        self.window.send_new(header, payload, offset + length, time.time())
+        return True
 
-        for j in range(int(self.windows_number), len(self.contents_dict)):
-            while 1:
-                # resend trigger
-                with self.send_timers_lock:
-                    for i in self.send_timers:
-                        if time.time() - self.send_timers[i] > self.rot:
-                            self.sender_socket.sendto(self.send_win_buffer[i], self.receiver_address)
-                            seq_no = int(self.contents_dict[i][2:12].decode('utf-8'))
-                            data_len = len(self.contents_dict[i][12:])
-                            resend_time = time.time()
-                            self.send_timers[i] = resend_time
-                            logging.debug(f"snd    {round((resend_time - self.initial_time)*1000, 2)}    DATA    {seq_no % 65536}    {data_len}")
-                            self.amount_of_resnd_data_segement += 1
-                    if len(self.send_win_buffer) < self.windows_number:
-                        self.sender_socket.sendto(self.contents_dict[j], self.receiver_address)
-                        self.send_win_buffer[j] = self.contents_dict[j]
-                        seq_no = int(self.contents_dict[j][2:12].decode('utf-8'))
-                        data_len = len(self.contents_dict[j][12:])
-                        self.amount_of_original_data += data_len
-                        start_time = time.time()
-                        self.send_timers[j] = start_time
-                        logging.debug(f"snd    {round((start_time - self.initial_time) * 1000, 2)}    DATA    {seq_no % 65536}    {data_len}")
-                        break
-            # self.sender_socket.sendto(self.contents_dict[j], self.receiver_address)
-            # with self.send_win_lock:
-            #     self.send_win_buffer[j] = self.contents_dict[j]
-            # seq_no = int(self.contents_dict[j][2:12].decode('utf-8'))
-            # data_len = len(self.contents_dict[j][12:])
-            # start_time = time.time()
-            # with self.send_timers_lock:
-            #     self.send_timers[j] = start_time
-            # logging.debug(f"snd  {round((start_time - self.initial_time)*1000, 2)}    DATA  {seq_no}  {data_len}")
+    def _window_probe(self):
+        '''(Call with the window lock held) send an empty data segment at the next new byte, its ACK repeats the window'''
+        seq_no = (self.relative_0 + self.window.scoreboard.end_offset) % ptp_header.SEQ_MODULO
+        if self.encoder is None:
+            header, payload = ptp_header.pack_header(ptp_header.DATA, seq_no, conn_id=self.conn_id,
+                                                     version=self.header_version), b""
+        else:
+            header, payload = self.encoder.pack(seq_no, b"", self.conn_id, self.header_version)
+        self._transmit(header, payload)
+        self._trace(ptp_trace.SEND, ptp_header.DATA, seq_no)
 
-        if len(self.send_timers) > 0:
-            while 1:
-                with self.send_timers_lock:
-                    for i in self.send_timers:
-                        if time.time() - self.send_timers[i] > self.rot:
-                            self.sender_socket.sendto(self.send_win_buffer[i], self.receiver_address)
-                            seq_no = int(self.contents_dict[i][2:12].decode('utf-8'))
-                            data_len = len(self.contents_dict[i][12:])
-                            resend_time = time.time()
-                            self.send_timers[i] = resend_time
-                            logging.debug(f"snd    {round((resend_time - self.initial_time)*1000, 2)}    DATA    {seq_no}    {data_len}")
-                            self.amount_of_resnd_data_segement += 1
-                if len(self.send_timers) == 0:
-                    break
+    def _transmit(self, header, payload):
+        '''queue a segment, ptp_send flushes the queue once the window is full'''
+        self.batch_sender.queue(header, payload, self.receiver_address)
 
-        # for send_content in self.sender_contents:
-        #     self.sender_socket.sendto(send_content, self.receiver_address)
-        #     seq_no = int.from_bytes(send_content[2: 4], byteorder='big')
-        #     data_len = len(send_content[4:])
-        #     logging.debug(f"snd  Time    DATA  {seq_no}  {data_len}")
-        #     time.sleep(0.5)
+    def ptp_send(self):
+        '''
+        Fill the window, then sleep until either the earliest retransmission timer
+        expires or listen() frees window space, instead of polling every timer.
+        The window is the smaller of the congestion window and max_win, and no
+        segment goes beyond the receiver's window. The segments of one pass are
+        handed to the kernel together.
+        '''
+        window = self.window
+        exhausted = False
+        with window.timer.cond:
+            while not exhausted or len(window):
+                window.on_timers(time.time())
+                while not exhausted and window.can_send(self.mss):
+                    exhausted = not self._next_segment()
+                self.batch_sender.flush()
+                if len(window):
+                    window.timer.wait()
+                elif not exhausted:
+                    # the receiver's window is shut and no ACK is on its way to open it
+                    window.persist(time.time())
+                    window.timer.wait()
 
     def ptp_close(self):
         # todo add codes here
         self._is_active = False  # close the sub-thread
-        # self.sender_socket.close()
-
-
+        if threading.current_thread() is not self.listen_thread:
+            # wake listen() out of recvfrom with an empty datagram, then release the socket
+            self.sender_socket.sendto(b"", self.sender_socket.getsockname())
+            self.listen_thread.join()
+            self.sender_socket.close()
+        with self.window.timer.cond:
+            self.window.clear()
+        if self.segmenter is not None:
+            self.segmenter.close()
 
     def listen(self):
         '''(Multithread is used)listen the response from receiver'''
         # logging.debug("Sub-thread for listening is running")
         while self._is_active:
             # todo add socket
-            incoming_message, _ = self.sender_socket.recvfrom(BUFFERSIZE)
-            type_no_int = int.from_bytes(incoming_message[0: 2], byteorder='big')
-            if type_no_int == 1:
-                self.amount_of_ack += 1
-                seq_no_int = int(incoming_message[2:12].decode('utf-8'))
+            for incoming_message, _ in self.batch_receiver.drain(block=True):
+                # an empty datagram only wakes us up (see ptp_close), a truncated one is ignored
+                if ptp_header.is_complete(incoming_message):
+                    self._handle(incoming_message)
+
+    def _handle(self, incoming_message):
+        '''process one segment from the receiver'''
+        version, type_no_int, flags, _, seq_no_int, advertised, _, _ = ptp_header.unpack(incoming_message)
+        payload = incoming_message[ptp_header.header_size(version):]
+        if type_no_int == ptp_header.RESET:
+            self._trace(ptp_trace.RECEIVE, ptp_header.RESET, 0)
+            self.SYN_event.set()
+            self.FIN_event.set()
+        elif type_no_int == ptp_header.ACK:
+            if flags & ptp_header.FLAG_PROBE:
+                self._trace(ptp_trace.RECEIVE, ptp_header.ACK, 0, seq_no_int)
+                self.probe_acked = seq_no_int
+                self.probe_event.set()
+            elif not self.SYN_event.is_set():
                 if seq_no_int == self.relative_0:
-                    self.SYN_successful = True
-                    logging.debug(f"rcv    {round((time.time() - self.initial_time)*1000, 2)}    ACK    {seq_no_int % 65536}    0")
-                elif (seq_no_int - self.relative_0) % 1000 == 0:
-                    logging.debug(f"rcv    {round((time.time() - self.initial_time)*1000, 2)}    ACK    {seq_no_int % 65536}    0")
-                    rm_num = 0
-                    with self.send_win_lock:
-                        for i in self.send_win_buffer:
-                            if int(self.send_win_buffer[i][2:12].decode('utf-8')) == seq_no_int - 1000:
-                                rm_num = i
-                                break
-                        self.send_win_buffer.pop(rm_num)
-                        # print(self.send_win_buffer)
-                        # print(rm_num)
-                    with self.send_timers_lock:
-                        self.send_timers.pop(rm_num)
-                elif seq_no_int == self.FIN_seq + 1:
-                    self.FIN_successful = True
-                    logging.debug(f"rcv    {round((time.time() - self.initial_time)*1000, 2)}    ACK    {seq_no_int % 65536}    0")
-                else:
-                    logging.debug(f"rcv    {round((time.time() - self.initial_time)*1000, 2)}    ACK    {seq_no_int % 65536}    0")
-                    rm_num = 0
-                    with self.send_win_lock:
-                        for i in self.send_win_buffer:
-                            if int(self.send_win_buffer[i][2:12].decode('utf-8')) == seq_no_int - self.last_data_len:
-                                rm_num = i
-                                break
-                        self.send_win_buffer.pop(rm_num)
-                    with self.send_timers_lock:
-                        self.send_timers.pop(rm_num)
+                    self._trace(ptp_trace.RECEIVE, ptp_header.ACK, 0, seq_no_int)
+                    # the ACK of the SYN carries the header version and the MSS chosen by the receiver
+                    if version in ptp_header.SUPPORTED_VERSIONS:
+                        options = ptp_header.unpack_options(payload)
+                        self.header_version = version
+                        self.mss = min(self.mss, ptp_header.mss_of(options))
+                        self._resume(options.get(ptp_header.OPT_RESUME))
+                        codec = ptp_codec.accept(options.get(ptp_header.OPT_CODEC))
+                        if codec is not None:
+                            self.encoder = ptp_codec.Encoder(*codec)
+                        self.window_scale = ptp_header.window_scale_of(options)
+                        if self.window_scale is not None:
+                            self.peer_window = advertised << self.window_scale
+                        self.SYN_successful = True
+                    self.SYN_event.set()
+            elif seq_no_int == (self.FIN_seq + 1) % ptp_header.SEQ_MODULO:
+                self._trace(ptp_trace.RECEIVE, ptp_header.ACK, 0, seq_no_int)
+                self.FIN_successful = True
+                self.FIN_event.set()
+            else:
+                blocks = ptp_header.unpack_sack(payload) if flags & ptp_header.FLAG_SACK else ()
+                advertised = advertised << self.window_scale if self.window_scale is not None else None
+                with self.window.timer.cond:
+                    if self.window.on_ack(seq_no_int, blocks, time.time(), advertised):
+                        self.window.timer.notify()
 
     def run(self):
         '''
@@ -217,58 +338,70 @@ class Sender:
         '''
         # todo add/modify codes here
         # send SYN and ensure it is limiter than 3 times
-        type_no = 2
-        seq_no = self.ISN
-        content = type_no.to_bytes(2, "big") + bytes(str(seq_no), 'utf-8').zfill(10) + b""
+        options = {ptp_header.OPT_MSS: ptp_header.MSS_VALUE.pack(self.mss)}
+        if self.length is not None:
+            # tell the receiver where this stripe goes
+            options[ptp_header.OPT_RANGE] = ptp_header.RANGE_VALUE.pack(self.offset, os.path.getsize(self.filename))
+        else:
+            self.fingerprint = ptp_resume.fingerprint(self.filename)
+            options[ptp_header.OPT_RESUME] = ptp_header.RESUME_VALUE.pack(os.path.getsize(self.filename),
+                                                                        ptp_resume.CHUNK_SIZE, self.fingerprint)
+        options[ptp_header.OPT_CODEC] = ptp_header.CODEC_VALUE.pack(True, *self.compression)
+        options = ptp_header.pack_options(options)
+        content = ptp_header.pack(ptp_header.SYN, self.ISN, payload=options, conn_id=self.conn_id)
         finished = False
         closed = False
         i = 0
         for i in range(3):
             self.sender_socket.sendto(content, self.receiver_address)
-            start_time = time.time()
-            self.initial_time = start_time
-            logging.debug(f"snd    {round((start_time - self.initial_time) * 1000, 2)}    SYN    {self.ISN}    0")
-            while 1:
-                if time.time() - start_time > self.rot:
-                    break
-                if self.SYN_successful:
-                    self.ptp_open()
-                    self.ptp_send()
-                    self.ptp_close()
-                    self.SYN_successful = False
-                    finished = True
+            self.initial_time = time.time()
+            self._trace(ptp_trace.SEND, ptp_header.SYN, self.ISN)
+            if self.SYN_event.wait(self.rot):
+                if not self.SYN_successful:
+                    # the receiver reset the connection, e.g. no common header version
                     break
+                if self.probe:
+                    self._probe_mss()
+                self._open_window()
+                self.ptp_open()
+                self.ptp_send()
+                self.SYN_successful = False
+                finished = True
             if finished:
-                type_no = 3
-                seq_no = self.FIN_seq
-                content = type_no.to_bytes(2, "big") + bytes(str(seq_no), 'utf-8').zfill(10) + b""
+                content = ptp_header.pack(ptp_header.FIN, self.FIN_seq, conn_id=self.conn_id, version=self.header_version)
+                # never less than the SYN got, and doubled for every FIN lost
+                timeout = max(self.rot, self.rto.rto)
                 for j in range(3):
                     self.sender_socket.sendto(content, self.receiver_address)
-                    close_time = time.time()
-                    logging.debug(f"snd    {round((close_time - self.initial_time) * 1000, 2)}    FIN    {self.FIN_seq}    0")
-                    while 1:
-                        if time.time() - close_time > self.rot:
-                            break
+                    self._trace(ptp_trace.SEND, ptp_header.FIN, self.FIN_seq)
+                    if self.FIN_event.wait(timeout * 2 ** j):
                         if self.FIN_successful:
-                            self.amount_of_data_segement_sent = len(self.sender_contents)
                             logging.debug(
                                 f"Amount of (original) Data Transferred (in bytes) (excluding retransmissions): {self.amount_of_original_data} bytes\n"
+                                f"Amount of Data already at the receiver (resumed, in bytes): {self.resumed_bytes} bytes\n"
                                 f"Number of Data Segments Sent (excluding retransmissions): {self.amount_of_data_segement_sent}\n"
-                                f"Number of Retransmitted Data Segments: {self.amount_of_resnd_data_segement}\n"
-                                f"Number of Duplicate Acknowledgements received: {self.amount_of_ack}")
+                                f"Number of Retransmitted Data Segments: {self.window.amount_of_resnd_data_segement}\n"
+                                f"Number of Duplicate Acknowledgements received: {self.window.amount_of_dup_ack}\n"
+                                f"Number of Window Probes Sent: {self.window.amount_of_window_probes}\n"
+                                f"Smoothed RTT (in milliseconds): {round((self.rto.srtt or 0) * 1000, 2)}\n"
+                                f"Final RTO (in milliseconds): {round(self.rto.rto * 1000, 2)}\n"
+                                f"Segment size (MSS, in bytes): {self.mss}\n"
+                                f"Payload bytes on the wire per byte of data: {round(self.encoder.ratio() if self.encoder else 1.0, 3)}\n"
+                                f"Final congestion window ({self.cc.name}, in segments): {round(self.cc.cwnd, 2)}\n"
+                                f"Data packets sent per second: {round(self.batch_sender.stats.packets_per_second(), 2)}\n"
+                                f"Send system calls per MB: {round(self.batch_sender.stats.syscalls_per_mb(), 2)}\n"
+                                f"Receive system calls per ACK: {round(self.batch_receiver.stats.syscalls / max(1, self.batch_receiver.stats.datagrams), 3)}")
                             closed = True
                             break
                     if closed:
                         break
                 break
 
-        if not self.SYN_successful:
-            if i >= 2:
-                type_no = 4
-                seq_no = 0
-                content = type_no.to_bytes(2, "big") + bytes(str(seq_no), 'utf-8').zfill(10) + b""
-                self.sender_socket.sendto(content, self.receiver_address)
-            self.ptp_close()
+        if not finished and i >= 2:
+            content = ptp_header.pack(ptp_header.RESET, 0, conn_id=self.conn_id)
+            self.sender_socket.sendto(content, self.receiver_address)
+        # listen() is only stopped now, after the FIN exchange it had to take part in
+        self.ptp_close()
 
 
 if __name__ == '__main__':
@@ -280,10 +413,18 @@ if __name__ == '__main__':
         format='%(message)20s',
         datefmt='%Y-%m-%d:%H:%M:%S')
 
-    if len(sys.argv) != 6:
+    if len(sys.argv) not in (6, 7, 8, 9, 10):
         print(
-            "\n===== Error usage, python3 sender.py sender_port receiver_port FileReceived.txt max_win rot ======\n")
+            "\n===== Error usage, python3 sender.py sender_port receiver_port FileReceived.txt max_win rot [reno|cubic] [mss] [probe] [none|zlib|lzma[:level]] ======\n")
         exit(0)
 
     sender = Sender(*sys.argv[1:])
+    trace_file = os.environ.get("PTP_TRACE")
+    if trace_file:
+        sender.tracer.enable()
+    ptp_trace.install_signal_toggle(sender.tracer)
     sender.run()
+    if trace_file:
+        sender.tracer.dump(trace_file)
+    if os.environ.get("PTP_METRICS"):
+        sender.metrics.write(os.environ["PTP_METRICS"])
@@ -0,0 +1,101 @@
+import asyncio
+import random
+
+import ptp_asyncio
+from ptp_emulator import Link, LinkEmulator
+
+
+async def serve(handler, receive_window=ptp_asyncio.RECEIVE_WINDOW):
+    server = await ptp_asyncio.start_server(handler, "127.0.0.1", 0, receive_window=receive_window)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_transfer_through_a_lossy_link():
+    data = random.Random(1).randbytes(300_000)
+
+    async def main():
+        received = []
+
+        async def handle(reader):
+            received.append(await reader.read())
+
+        server, port = await serve(handle)
+        emulator = LinkEmulator(("127.0.0.1", port), Link(loss=0.02, reorder=0.05), Link(), seed=1)
+        try:
+            writer = await ptp_asyncio.open_connection("127.0.0.1", emulator.address[1], max_win=64000, rot=100)
+            writer.write(data)
+            await writer.drain()
+            await writer.wait_closed()
+            await asyncio.sleep(0.1)
+        finally:
+            emulator.close()
+            server.close()
+        return received
+
+    assert asyncio.run(main()) == [data]
+
+
+def test_stalled_reader_stops_the_sender():
+    data = random.Random(2).randbytes(2_000_000)
+    receive_window = 64 * 1024
+
+    async def main():
+        go = asyncio.Event()
+        received = []
+
+        async def handle(reader):
+            await go.wait()
+            received.append(await reader.read())
+
+        server, port = await serve(handle, receive_window)
+        try:
+            writer = await ptp_asyncio.open_connection("127.0.0.1", port, max_win=256000, rot=100)
+            writer.write(data)
+            await asyncio.sleep(1.0)
+            # the reader buffers up to twice its limit, the ring holds the rest the sender may send
+            acknowledged = writer.window.scoreboard.acked_offset
+            assert 0 < acknowledged <= receive_window + 2 * 2 ** 16 + receive_window
+            assert writer.window.send_limit <= acknowledged + receive_window
+            go.set()
+            await writer.drain()
+            await writer.wait_closed()
+            await asyncio.sleep(0.1)
+        finally:
+            server.close()
+        return received
+
+    assert asyncio.run(main()) == [data]
+
+
+def test_advertised_window_bounds_the_data_in_flight():
+    data = random.Random(3).randbytes(500_000)
+    receive_window = 8 * 1000
+
+    async def main():
+        received = []
+        in_flight = []
+
+        async def handle(reader):
+            received.append(await reader.read())
+
+        server, port = await serve(handle, receive_window)
+        try:
+            writer = await ptp_asyncio.open_connection("127.0.0.1", port, max_win=256000, rot=100)
+            window = writer.window
+            send = window.send
+
+            def watched(header, payload):
+                in_flight.append(window.scoreboard.bytes_in_flight())
+                send(header, payload)
+            window.send = watched
+            writer.write(data)
+            await writer.drain()
+            await writer.wait_closed()
+            await asyncio.sleep(0.1)
+        finally:
+            server.close()
+        return received, in_flight
+
+    received, in_flight = asyncio.run(main())
+    assert received == [data]
+    assert in_flight and max(in_flight) <= receive_window
@@ -0,0 +1,91 @@
+import ctypes
+import errno
+import socket
+
+import pytest
+
+import ptp_batchio
+from ptp_batchio import BatchReceiver, BatchSender
+
+needs_mmsg = pytest.mark.skipif(ptp_batchio._mmsg_functions is None, reason="no sendmmsg/recvmmsg here")
+
+
+@pytest.fixture
+def pair():
+    receiving = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiving.bind(("127.0.0.1", 0))
+    receiving.setblocking(False)
+    sending = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sending.bind(("127.0.0.1", 0))
+    yield sending, receiving
+    sending.close()
+    receiving.close()
+
+
+@pytest.mark.parametrize("mmsg", [pytest.param(True, marks=needs_mmsg), False])
+def test_round_trip(pair, mmsg):
+    sending, receiving = pair
+    sender = BatchSender(sending, max_batch=16)
+    receiver = BatchReceiver(receiving, 2048, max_batch=16)
+    sender._mmsg = receiver._mmsg = mmsg
+    for n in range(40):
+        sender.queue(n.to_bytes(2, "big"), bytearray(b"x" * n), receiving.getsockname())
+    assert len(sender) == 8  # two full batches went out on their own
+    sender.flush()
+    assert len(sender) == 0
+    received = []
+    while len(received) < 40:
+        batch = receiver.drain()
+        assert batch, "datagrams lost on the loopback"
+        received.extend((bytes(view), address) for view, address in batch)
+    assert [int.from_bytes(data[:2], "big") for data, _ in received] == list(range(40))
+    assert all(data[2:] == b"x" * (len(data) - 2) for data, _ in received)
+    assert {address for _, address in received} == {sending.getsockname()}
+    nbytes = sum(2 + n for n in range(40))
+    assert (sender.stats.datagrams, sender.stats.bytes, receiver.stats.datagrams, receiver.stats.bytes) == \
+        (40, nbytes, 40, nbytes)
+    if mmsg:
+        assert sender.stats.syscalls == 3
+        assert receiver.stats.syscalls <= 3
+    assert sender.stats.dropped == 0
+    assert receiver.drain() == []
+
+
+class FullSocket(socket.socket):
+    '''a socket whose send buffer is always full'''
+
+    def sendmsg(self, *args):
+        raise BlockingIOError(errno.EAGAIN, "full")
+
+    def sendto(self, *args):
+        raise BlockingIOError(errno.EAGAIN, "full")
+
+
+def test_datagrams_without_room_are_dropped_and_counted():
+    with FullSocket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sender = BatchSender(sock)
+        sender._mmsg = False
+        for _ in range(5):
+            sender.queue(b"h", b"payload", ("127.0.0.1", 9))
+        sender.flush()
+        assert (sender.stats.dropped, sender.stats.datagrams) == (5, 0)
+
+
+@needs_mmsg
+def test_rest_of_a_batch_is_dropped_when_sendmmsg_finds_no_room(pair, monkeypatch):
+    calls = []
+
+    def sendmmsg(fd, msgs, count, flags):
+        calls.append(count)
+        if len(calls) == 1:
+            return 3
+        ctypes.set_errno(errno.ENOBUFS)
+        return -1
+
+    monkeypatch.setattr(ptp_batchio, "_mmsg_functions", (sendmmsg, ptp_batchio._mmsg_functions[1]))
+    sender = BatchSender(pair[0])
+    for _ in range(10):
+        sender.queue(b"h", b"payload", pair[1].getsockname())
+    sender.flush()
+    assert calls == [10, 7]
+    assert (sender.stats.datagrams, sender.stats.dropped, sender.stats.syscalls) == (3, 7, 1)
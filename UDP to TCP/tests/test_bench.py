@@ -0,0 +1,35 @@
+import json
+
+import ptp_bench
+
+
+def test_percentile_is_nearest_rank():
+    assert ptp_bench.percentile([3, 1, 2], 50) == 2
+    assert ptp_bench.percentile([3, 1, 2], 99) == 3
+    assert ptp_bench.percentile(list(range(1, 101)), 99) == 99
+
+
+def test_goodput_counts_completed_runs_only(monkeypatch):
+    runs = iter([{"completed": True, "seconds": 1.0, "cpu_seconds": 0.1, "retransmission_ratio": 0.0,
+                  "host_dropped": 0},
+                 {"completed": False, "seconds": 30.0, "cpu_seconds": 0.1, "retransmission_ratio": 0.5,
+                  "host_dropped": 0},
+                 {"completed": True, "seconds": 2.0, "cpu_seconds": 0.1, "retransmission_ratio": 0.0,
+                  "host_dropped": 0}])
+    monkeypatch.setattr(ptp_bench, "run_once", lambda *args: next(runs))
+    args = ptp_bench.argparse.Namespace(repeat=3, seed=1)
+    cell = ptp_bench.run_cell("source", 1_000_000, 64000, 0.0, args, "workdir")
+    assert cell["completed"] == 2
+    assert cell["goodput_mbps"] == 6.0  # the median of 8 and 4 Mbit/s
+    assert cell["p99_is_max"]
+
+
+def test_runs_that_never_connect_are_not_completed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    output = tmp_path / "results.json"
+    # every SYN is lost, so the receiver never creates the file
+    ptp_bench.main(["--sizes", "1000", "--windows", "4000", "--losses", "1.0", "--repeat", "1",
+                    "--output", str(output)])
+    cell, = json.loads(output.read_text())["results"]
+    assert cell["completed"] == 0
+    assert cell["goodput_mbps"] is None
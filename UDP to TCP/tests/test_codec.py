@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+import ptp_codec
+import ptp_header
+
+MSS = 1000
+
+
+def round_trip(checksum, method, level, payload):
+    encoder = ptp_codec.Encoder(checksum, method, level)
+    decoder = ptp_codec.Decoder(checksum, method, level, MSS)
+    header, body = encoder.pack(42, payload, conn_id=1, version=2)
+    segment = header + body
+    _, _, flags, seq_no, _, _, length, _ = ptp_header.unpack(segment)
+    assert seq_no == 42
+    assert length == len(segment) - ptp_header.HEADER_SIZE
+    return decoder, flags, segment
+
+
+@pytest.mark.parametrize("method", [ptp_codec.COMPRESS_NONE, ptp_codec.COMPRESS_ZLIB, ptp_codec.COMPRESS_LZMA])
+@pytest.mark.parametrize("checksum", [False, True])
+def test_round_trip(checksum, method):
+    payload = b"abcdefgh" * 100
+    decoder, flags, segment = round_trip(checksum, method, ptp_codec.DEFAULT_LEVELS[method], payload)
+    assert bool(flags & ptp_header.FLAG_COMPRESSED) == (method != ptp_codec.COMPRESS_NONE)
+    assert bytes(decoder.unpack(segment, flags, ptp_header.HEADER_SIZE)) == payload
+
+
+def test_incompressible_payload_goes_out_as_is():
+    payload = os.urandom(MSS)
+    decoder, flags, segment = round_trip(True, ptp_codec.COMPRESS_ZLIB, 1, payload)
+    assert not flags & ptp_header.FLAG_COMPRESSED
+    assert bytes(decoder.unpack(segment, flags, ptp_header.HEADER_SIZE)) == payload
+
+
+def test_backoff_after_misses():
+    encoder = ptp_codec.Encoder(False, ptp_codec.COMPRESS_ZLIB, 1)
+    for _ in range(ptp_codec.MAX_MISSES):
+        encoder.pack(0, os.urandom(100), conn_id=0, version=2)
+    encoder.pack(0, b"a" * 100, conn_id=0, version=2)
+    assert encoder.compressed == 0  # compressible, but not tried during the backoff
+
+
+@pytest.mark.parametrize("position", [0, 5, ptp_header.HEADER_SIZE + 1, -1])
+def test_corruption_is_detected(position):
+    decoder, flags, segment = round_trip(True, ptp_codec.COMPRESS_ZLIB, 1, b"abcdefgh" * 100)
+    corrupt = bytearray(segment)
+    corrupt[position] ^= 0x10
+    assert decoder.unpack(bytes(corrupt), flags, ptp_header.HEADER_SIZE) is None
+
+
+def test_missing_checksum_is_rejected():
+    decoder = ptp_codec.Decoder(True, ptp_codec.COMPRESS_NONE, 0, MSS)
+    segment = ptp_header.pack(ptp_header.DATA, 0, payload=b"plain")
+    assert decoder.unpack(segment, 0, ptp_header.HEADER_SIZE) is None
+
+
+def test_decompression_bomb_is_rejected():
+    encoder = ptp_codec.Encoder(False, ptp_codec.COMPRESS_ZLIB, 1)
+    decoder = ptp_codec.Decoder(False, ptp_codec.COMPRESS_ZLIB, 1, MSS)
+    header, body = encoder.pack(0, b"\x00" * (10 * MSS), conn_id=0, version=2)
+    _, _, flags, _, _, _, _, _ = ptp_header.unpack(header)
+    assert decoder.unpack(header + body, flags, ptp_header.HEADER_SIZE) is None
+
+
+def test_parse_and_accept():
+    assert ptp_codec.parse(None) == (ptp_codec.COMPRESS_NONE, 0)
+    assert ptp_codec.parse("zlib:12") == (ptp_codec.COMPRESS_ZLIB, 9)
+    with pytest.raises(ValueError):
+        ptp_codec.parse("brotli")
+    assert ptp_codec.accept(None) is None
+    assert ptp_codec.accept(ptp_header.CODEC_VALUE.pack(1, 99, 5)) == (True, ptp_codec.COMPRESS_NONE, 0)
@@ -0,0 +1,67 @@
+import pytest
+
+import ptp_congestion
+from ptp_congestion import CongestionControl, Cubic, Reno
+
+
+def test_reno_slow_start_then_additive_increase():
+    reno = Reno(100, initial_window=2)
+    reno.ssthresh = 8.0
+    reno.on_ack(2, 0.0)
+    reno.on_ack(4, 0.0)
+    assert reno.window == 8
+    reno.on_ack(8, 0.0)  # one window of ACKs past ssthresh adds about one segment
+    assert reno.cwnd == pytest.approx(9.0)
+
+
+def test_reno_halves_on_loss_and_restarts_on_timeout():
+    reno = Reno(100)
+    reno.on_loss(20, 0.0)
+    assert (reno.cwnd, reno.ssthresh) == (10.0, 10.0)
+    reno.on_timeout(20, 0.0)
+    assert (reno.window, reno.ssthresh) == (1, 10.0)
+    reno.on_loss(1, 0.0)
+    assert reno.ssthresh == 2.0
+
+
+def test_window_never_exceeds_the_maximum():
+    for algorithm in (Reno, Cubic):
+        cc = algorithm(16)
+        for now in range(1000):
+            cc.on_ack(16, float(now))
+        assert cc.window == 16
+
+
+def test_cubic_backs_off_by_beta_and_regrows_to_the_last_peak():
+    cubic = Cubic(1000)
+    cubic.cwnd = cubic.ssthresh = 100.0
+    cubic.on_loss(100, 0.0)
+    assert cubic.cwnd == pytest.approx(100 * Cubic.BETA)
+    assert cubic.w_max == 100.0
+    cubic.on_ack(1, 0.0)  # starts the epoch
+    k = ((100 - 70) / Cubic.C) ** (1 / 3)
+    assert cubic.k == pytest.approx(k)
+    # the window reaches the old peak about K seconds into the epoch and grows past it after
+    for _ in range(20):
+        cubic.on_ack(int(cubic.cwnd), k + 0.05)
+    assert cubic.cwnd == pytest.approx(100.0, rel=0.05)
+    for _ in range(20):
+        cubic.on_ack(int(cubic.cwnd), k + 3.0)
+    assert cubic.cwnd > 105.0
+
+
+def test_cubic_fast_convergence():
+    cubic = Cubic(1000)
+    cubic.w_max = 100.0
+    cubic.cwnd = cubic.ssthresh = 80.0
+    cubic.on_loss(80, 0.0)
+    assert cubic.w_max == pytest.approx(80 * (1 + Cubic.BETA) / 2)
+
+
+def test_create():
+    assert isinstance(ptp_congestion.create("CUBIC", 10), Cubic)
+    assert ptp_congestion.create("reno", 10).max_window == 10
+    with pytest.raises(ValueError):
+        ptp_congestion.create("vegas", 10)
+    with pytest.raises(TypeError):
+        CongestionControl(10)
@@ -0,0 +1,63 @@
+import pytest
+
+import ptp_header
+
+
+def test_pack_unpack_round_trip():
+    segment = ptp_header.pack(ptp_header.DATA, ptp_header.SEQ_MODULO + 5, 7, b"payload", window=9, version=1)
+    assert len(segment) == ptp_header.header_size(1) + len(b"payload")
+    version, kind, flags, seq_no, ack_no, window, length, _ = ptp_header.unpack(segment)
+    assert (version, kind, flags, seq_no, ack_no, window, length) == (1, ptp_header.DATA, 0, 5, 7, 9, 7)
+    assert segment[-7:] == b"payload"
+    assert ptp_header.seq_of(segment) == 5
+
+
+def test_negotiate():
+    assert ptp_header.negotiate(ptp_header.HEADER_VERSION + 1) == ptp_header.HEADER_VERSION
+    assert ptp_header.negotiate(1) == 1
+    assert ptp_header.negotiate(0) is None
+
+
+def test_seq_diff_across_wraparound():
+    assert ptp_header.seq_diff(2, ptp_header.SEQ_MODULO - 3) == 5
+    assert ptp_header.seq_diff(ptp_header.SEQ_MODULO - 3, 2) == -5
+
+
+def test_sack_round_trip():
+    blocks = [(10, 20), (30, 40), (50, 60), (70, 80), (90, 100)]
+    payload = ptp_header.pack_sack(blocks)
+    assert ptp_header.unpack_sack(payload) == blocks[:ptp_header.MAX_SACK_BLOCKS]
+    assert ptp_header.unpack_sack(payload + b"\x00") == blocks[:ptp_header.MAX_SACK_BLOCKS]
+
+
+@pytest.mark.parametrize("version", ptp_header.SUPPORTED_VERSIONS)
+def test_connection_id_round_trip(version):
+    segment = ptp_header.pack(ptp_header.DATA, 5, 7, b"payload", conn_id=3, version=version)
+    assert len(segment) == ptp_header.header_size(version) + len(b"payload")
+    assert ptp_header.unpack(segment)[0] == version
+    assert ptp_header.unpack(segment)[-1] == (3 if version >= 2 else 0)
+
+
+def test_is_complete():
+    segment = ptp_header.pack(ptp_header.ACK, 1, version=2)
+    assert ptp_header.is_complete(segment)
+    assert not ptp_header.is_complete(segment[:-1])
+    assert not ptp_header.is_complete(b"")
+    assert ptp_header.is_complete(ptp_header.pack(ptp_header.ACK, 1, version=1))
+
+
+def test_options_round_trip():
+    options = {ptp_header.OPT_MSS: ptp_header.MSS_VALUE.pack(1400), 99: b"unknown"}
+    parsed = ptp_header.unpack_options(ptp_header.pack_options(options))
+    assert parsed == options
+    assert ptp_header.mss_of(parsed) == 1400
+
+
+def test_options_defaults_and_truncation():
+    assert ptp_header.mss_of({}) == ptp_header.DEFAULT_MSS
+    assert ptp_header.mss_of({ptp_header.OPT_MSS: b"\x05"}) == ptp_header.DEFAULT_MSS
+    assert ptp_header.mss_of({ptp_header.OPT_MSS: ptp_header.MSS_VALUE.pack(0)}) == 1
+    assert ptp_header.mss_of({ptp_header.OPT_MSS: ptp_header.MSS_VALUE.pack(65535)}) == ptp_header.MAX_MSS
+    payload = ptp_header.pack_options({ptp_header.OPT_MSS: ptp_header.MSS_VALUE.pack(1400), 99: b"unknown"})
+    assert ptp_header.unpack_options(payload[:-1]) == {ptp_header.OPT_MSS: ptp_header.MSS_VALUE.pack(1400)}
+    assert ptp_header.unpack_options(payload[:2]) == {}
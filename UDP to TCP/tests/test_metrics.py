@@ -0,0 +1,51 @@
+import json
+
+from ptp_metrics import Metrics
+
+
+def filled():
+    metrics = Metrics("ptp_test")
+    metrics.counter("acks_total", "ACKs sent").inc(3)
+    metrics.gauge("connections", "connections in the table", lambda: 2)
+    histogram = metrics.histogram("rtt_seconds", "RTT samples", (0.01, 0.1))
+    for value in (0.005, 0.01, 0.05, 1.0):
+        histogram.observe(value)
+    return metrics
+
+
+def test_same_name_returns_the_same_instrument():
+    metrics = Metrics()
+    metrics.counter("retransmits_total", "retransmitted data segments").inc()
+    metrics.counter("retransmits_total", "retransmitted data segments").inc()
+    assert metrics.snapshot() == {"ptp_retransmits_total": 2}
+
+
+def test_json_export(tmp_path):
+    path = str(tmp_path / "metrics.json")
+    filled().write(path)
+    with open(path) as file:
+        exported = json.load(file)
+    assert exported == {
+        "ptp_test_acks_total": 3,
+        "ptp_test_connections": 2,
+        "ptp_test_rtt_seconds": {"buckets": {"0.01": 2, "0.1": 1, "+Inf": 1}, "sum": 1.065, "count": 4},
+    }
+
+
+def test_prometheus_export(tmp_path):
+    path = str(tmp_path / "metrics.prom")
+    filled().write(path)
+    with open(path) as file:
+        lines = file.read().splitlines()
+    assert "# TYPE ptp_test_acks_total counter" in lines
+    assert "ptp_test_acks_total 3" in lines
+    assert "# TYPE ptp_test_connections gauge" in lines
+    assert "ptp_test_connections 2" in lines
+    assert "# HELP ptp_test_rtt_seconds RTT samples" in lines
+    # the buckets are cumulative
+    assert [line for line in lines if line.startswith("ptp_test_rtt_seconds_bucket")] == [
+        'ptp_test_rtt_seconds_bucket{le="0.01"} 2',
+        'ptp_test_rtt_seconds_bucket{le="0.1"} 3',
+        'ptp_test_rtt_seconds_bucket{le="+Inf"} 4',
+    ]
+    assert "ptp_test_rtt_seconds_count 4" in lines
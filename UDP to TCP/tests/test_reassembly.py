@@ -0,0 +1,84 @@
+import io
+
+import ptp_header
+from ptp_reassembly import Reassembler
+
+
+def test_in_order():
+    file = io.BytesIO()
+    reassembler = Reassembler(file, 100, capacity=16)
+    assert reassembler.offer(100, b"abcd")
+    assert reassembler.next_seq == 104
+    reassembler.flush()
+    assert file.getvalue() == b"abcd"
+
+
+def test_out_of_order_and_duplicates():
+    file = io.BytesIO()
+    reassembler = Reassembler(file, 0, capacity=64)
+    assert reassembler.offer(8, b"ijkl")
+    assert reassembler.offer(4, b"efgh")
+    assert reassembler.next_seq == 0
+    assert reassembler.buffered == 8
+    assert reassembler.offer(0, b"abcd")
+    assert reassembler.next_seq == 12
+    assert reassembler.buffered == 0
+    assert reassembler.offer(2, b"cdef")  # a duplicate is accepted and ignored
+    reassembler.flush()
+    assert file.getvalue() == b"abcdefghijkl"
+
+
+def test_sequence_wraparound():
+    file = io.BytesIO()
+    start = ptp_header.SEQ_MODULO - 2
+    reassembler = Reassembler(file, start, capacity=16)
+    reassembler.offer(2, b"cd")
+    reassembler.offer(start, b"ab")
+    assert reassembler.next_seq == 0
+    reassembler.offer(0, b"xy")
+    reassembler.flush()
+    assert file.getvalue() == b"abxycd"
+
+
+def test_sack_blocks_describe_the_buffered_ranges():
+    reassembler = Reassembler(io.BytesIO(), 0, capacity=64)
+    reassembler.offer(8, b"ijkl")
+    reassembler.offer(4, b"efgh")
+    reassembler.offer(20, b"uv")
+    assert sorted(reassembler.sack_blocks()) == [(4, 12), (20, 22)]
+    reassembler.offer(0, b"abcd")
+    assert reassembler.sack_blocks() == [(20, 22)]
+
+
+def test_window_shrinks_until_the_data_is_written():
+    file = io.BytesIO()
+    reassembler = Reassembler(file, 100, capacity=16)
+    reassembler.offer(100, b"abcd")
+    reassembler.offer(108, b"ij")  # out-of-order data holds its place in the ring
+    assert reassembler.unwritten == 4
+    assert reassembler.window() == 12
+    assert reassembler.flush() == 4
+    assert reassembler.window() == 16
+
+
+def test_beyond_the_window_is_dropped():
+    reassembler = Reassembler(io.BytesIO(), 0, capacity=8)
+    assert not reassembler.offer(4, b"efghi")
+    assert reassembler.offer(4, b"efgh")
+
+
+def test_ring_wrap():
+    file = io.BytesIO()
+    reassembler = Reassembler(file, 0, capacity=10)
+    reassembler.offer(0, b"0123456")
+    reassembler.flush()
+    # a segment copied across the end of the ring, after an out-of-order one at its start
+    assert reassembler.offer(12, b"cd")
+    assert reassembler.offer(7, b"789ab")
+    assert reassembler.next_seq == 14
+    assert reassembler.window() == 3
+    assert reassembler.flush() == 7
+    assert reassembler.offer(14, b"efghijklmn")
+    assert not reassembler.offer(24, b"o")
+    reassembler.flush()
+    assert file.getvalue() == b"0123456789abcdefghijklmn"
@@ -0,0 +1,77 @@
+import errno
+import socket
+import time
+
+import ptp_header
+from receiver import Receiver
+
+
+class FullSocket(socket.socket):
+    '''a socket whose send buffer is always full'''
+
+    def sendmsg(self, *args):
+        raise BlockingIOError(errno.EAGAIN, "full")
+
+    def sendto(self, *args):
+        raise BlockingIOError(errno.EAGAIN, "full")
+
+
+def test_reset_for_an_unknown_version_is_dropped_when_the_send_buffer_is_full(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    receiver = Receiver(0, 0, str(tmp_path / "received"), 0, 0)
+    try:
+        monkeypatch.setattr(receiver.batch_sender, "sock", FullSocket(socket.AF_INET, socket.SOCK_DGRAM))
+        monkeypatch.setattr(receiver.batch_sender, "_mmsg", False)
+        syn = bytearray(ptp_header.pack(ptp_header.SYN, 0, conn_id=1))
+        syn[0] = (0 << 4) | ptp_header.SYN  # a version no receiver speaks
+        assert not receiver.handle(bytes(syn), ("127.0.0.1", 9))
+        receiver.batch_sender.flush()
+        assert receiver.batch_sender.stats.dropped == 1
+    finally:
+        receiver.batch_sender.sock.close()
+        receiver.receiver_socket.close()
+
+
+def segment(type_no, seq_no, conn_id, payload=b""):
+    return ptp_header.pack(type_no, seq_no, 0, payload, conn_id=conn_id, version=2)
+
+
+def test_one_receiver_serves_many_connections(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    receiver = Receiver(0, 0, "{host}_{port}_{conn_id}", 0, 0)
+    try:
+        senders = [(("127.0.0.1", 9), 1), (("127.0.0.1", 9), 2), (("127.0.0.2", 9), 1)]
+        for n, (address, conn_id) in enumerate(senders):
+            assert not receiver.handle(segment(ptp_header.SYN, 100 * n, conn_id), address)
+        assert len(receiver.flows) == 3
+        # the segments of the connections interleave, each in its own sequence space
+        for part in range(3):
+            for n, (address, conn_id) in enumerate(senders):
+                payload = f"{n}{part}".encode()
+                receiver.handle(segment(ptp_header.DATA, 100 * n + 1 + 2 * part, conn_id, payload), address)
+        for n, (address, conn_id) in enumerate(senders):
+            assert not receiver.handle(segment(ptp_header.FIN, 100 * n + 7, conn_id), address)
+        # an unknown connection is ignored
+        assert not receiver.handle(segment(ptp_header.DATA, 1, 9, b"x"), ("127.0.0.1", 9))
+        for n, (address, conn_id) in enumerate(senders):
+            assert (tmp_path / f"{address[0]}_9_{conn_id}").read_bytes() == f"{n}0{n}1{n}2".encode()
+    finally:
+        receiver.receiver_socket.close()
+
+
+def test_idle_connections_are_evicted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    receiver = Receiver(0, 0, "{host}_{port}_{conn_id}", 0, 0)
+    try:
+        receiver.handle(segment(ptp_header.SYN, 0, 1), ("127.0.0.1", 9))
+        receiver.handle(segment(ptp_header.SYN, 0, 2), ("127.0.0.1", 9))
+        receiver.handle(segment(ptp_header.DATA, 1, 1, b"kept"), ("127.0.0.1", 9))
+        now = time.time()
+        receiver.flows[(("127.0.0.1", 9), 2)].last_active = now - receiver.idle_timeout - 1
+        receiver.evict_idle(now)
+        assert list(receiver.flows) == [(("127.0.0.1", 9), 1)]
+        receiver.evict_idle(now + receiver.idle_timeout + 1)
+        assert not receiver.flows
+        assert (tmp_path / "127.0.0.1_9_1").read_bytes() == b"kept"
+    finally:
+        receiver.receiver_socket.close()
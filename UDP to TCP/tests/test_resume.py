@@ -0,0 +1,196 @@
+import os
+import random
+import socket
+import threading
+
+import pytest
+
+import ptp_header
+import ptp_resume
+import sender
+from receiver import Receiver
+from sender import Sender
+
+CHUNK = 16
+DIGEST = b"\x01" * ptp_resume.HASH_SIZE
+
+
+def bitmap(*done, chunks=8):
+    bits = bytearray((chunks + 7) // 8)
+    for n in done:
+        bits[n >> 3] |= 0x80 >> (n & 7)
+    return bytes(bits)
+
+
+def test_missing_ranges():
+    assert ptp_resume.missing_ranges(bitmap(), 100, CHUNK) == [(0, 100)]
+    assert ptp_resume.missing_ranges(bitmap(0, 3, 4), 100, CHUNK) == [(16, 32), (80, 20)]
+    assert ptp_resume.missing_ranges(bitmap(*range(7)), 100, CHUNK) == []
+    assert ptp_resume.missing_ranges(b"", 0, CHUNK) == []
+
+
+def test_fingerprint(tmp_path):
+    one, other = tmp_path / "one", tmp_path / "other"
+    one.write_bytes(b"a" * 100)
+    other.write_bytes(b"b" * 100)
+    assert ptp_resume.fingerprint(str(one)) == ptp_resume.fingerprint(str(one))
+    assert ptp_resume.fingerprint(str(one)) != ptp_resume.fingerprint(str(other))
+
+
+def test_chunk_size_must_be_positive(tmp_path):
+    with pytest.raises(ValueError):
+        ptp_resume.Progress.create(str(tmp_path / "file"), 100, 0, DIGEST)
+
+
+def test_resumable_writer_fills_the_missing_ranges(tmp_path):
+    filename = str(tmp_path / "file")
+    data = random.Random(1).randbytes(100)
+    with open(filename, "wb") as file:
+        file.write(data[:32] + bytes(68))
+    progress = ptp_resume.Progress.create(filename, len(data), CHUNK, DIGEST)
+    for n in range(2):
+        progress.mark(n, ptp_resume.chunk_hash(data[n * CHUNK:(n + 1) * CHUNK]))
+    progress.close()
+
+    progress = ptp_resume.Progress.open(filename, len(data), CHUNK, DIGEST)
+    assert progress.verify(filename) == 0
+    ranges = ptp_resume.missing_ranges(progress.bitmap, len(data), CHUNK)
+    assert ranges == [(32, 68)]
+    writer = ptp_resume.ResumableWriter(open(filename, "r+b"), progress, ranges)
+    stream = data[32:]
+    for start in range(0, len(stream), 7):  # pieces that do not line up with the chunks
+        writer.write(stream[start:start + 7])
+    assert progress.complete()
+    writer.close()
+    with open(filename, "rb") as file:
+        assert file.read() == data
+    assert not os.path.exists(filename + ptp_resume.SUFFIX)
+
+
+def test_interrupted_writer_leaves_only_whole_chunks_marked(tmp_path):
+    filename = str(tmp_path / "file")
+    data = bytes(range(100))
+    progress = ptp_resume.Progress.create(filename, len(data), CHUNK, DIGEST)
+    writer = ptp_resume.ResumableWriter(open(filename, "wb"), progress, [(0, len(data))])
+    writer.write(data[:40])
+    writer.close()
+    progress = ptp_resume.Progress.open(filename, len(data), CHUNK, DIGEST)
+    assert ptp_resume.missing_ranges(progress.bitmap, len(data), CHUNK) == [(32, 68)]
+    progress.close()
+
+
+def test_open_refuses_another_file(tmp_path):
+    filename = str(tmp_path / "file")
+    open(filename, "wb").close()
+    ptp_resume.Progress.create(filename, 100, CHUNK, DIGEST).close()
+    assert ptp_resume.Progress.open(filename, 100, CHUNK, b"\x02" * ptp_resume.HASH_SIZE) is None
+    assert ptp_resume.Progress.open(filename, 101, CHUNK, DIGEST) is None
+    assert ptp_resume.Progress.open(filename, 100, CHUNK * 2, DIGEST) is None
+    progress = ptp_resume.Progress.open(filename, 100, CHUNK, DIGEST)
+    assert progress is not None
+    progress.close()
+
+
+def test_verify_clears_chunks_changed_on_disk(tmp_path):
+    filename = str(tmp_path / "file")
+    data = bytes(64)
+    with open(filename, "wb") as file:
+        file.write(data)
+    progress = ptp_resume.Progress.create(filename, len(data), CHUNK, DIGEST)
+    for n in range(4):
+        progress.mark(n, ptp_resume.chunk_hash(data[n * CHUNK:(n + 1) * CHUNK]))
+    with open(filename, "r+b") as file:
+        file.seek(CHUNK + 1)
+        file.write(b"!")
+    assert progress.verify(filename) == 1
+    assert ptp_resume.missing_ranges(progress.bitmap, len(data), CHUNK) == [(CHUNK, CHUNK)]
+    progress.close()
+
+
+@pytest.mark.parametrize("size, chunk_size", [(100, 0), (1 << 60, 1)])
+def test_receiver_falls_back_to_a_plain_transfer(tmp_path, monkeypatch, size, chunk_size):
+    monkeypatch.chdir(tmp_path)
+    receiver = Receiver(0, 0, str(tmp_path / "received"), 0, 0)
+    try:
+        syn = ptp_header.pack(ptp_header.SYN, 0, payload=ptp_header.pack_options(
+            {ptp_header.OPT_RESUME: ptp_header.RESUME_VALUE.pack(size, chunk_size, DIGEST)}), conn_id=1)
+        assert not receiver.handle(syn, ("127.0.0.1", 9))
+        flow = receiver.flows[(("127.0.0.1", 9), 1)]
+        assert flow.resume_reply is None
+        assert not isinstance(flow.reassembler.file, ptp_resume.ResumableWriter)
+        assert not os.path.exists(str(tmp_path / "received") + ptp_resume.SUFFIX)
+    finally:
+        for flow in receiver.flows.values():
+            flow.close()
+        receiver.receiver_socket.close()
+
+
+@pytest.mark.parametrize("extra_chunks, resumed", [(0, True), (1, False)])
+def test_largest_resume_bitmap_reaches_the_sender(tmp_path, monkeypatch, extra_chunks, resumed):
+    monkeypatch.chdir(tmp_path)
+    filename = str(tmp_path / "received")
+    receiver = Receiver(0, 0, filename, 0, 0)
+    peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    peer.bind(("127.0.0.1", 0))
+    peer.settimeout(5)
+    try:
+        max_chunks = (receiver.max_mss // 2 - ptp_header.RESUME_VALUE.size) * 8
+        size = (max_chunks + extra_chunks) * CHUNK
+        open(filename, "wb").close()
+        ptp_resume.Progress.create(filename, size, CHUNK, DIGEST).close()
+        options = {ptp_header.OPT_RESUME: ptp_header.RESUME_VALUE.pack(size, CHUNK, DIGEST),
+                   ptp_header.OPT_CODEC: ptp_header.CODEC_VALUE.pack(1, 0, 0)}
+        syn = ptp_header.pack(ptp_header.SYN, 0, payload=ptp_header.pack_options(options), conn_id=1)
+        receiver.handle(syn, peer.getsockname())
+        receiver.batch_sender.flush()
+        reply, _ = peer.recvfrom(sender.BUFFERSIZE)
+        reply_options = ptp_header.unpack_options(reply[ptp_header.header_size(reply[0] >> 4):])
+        # a truncated ACK would lose the options, and with them the checksum both sides agreed on
+        assert ptp_header.OPT_CODEC in reply_options
+        assert (ptp_header.OPT_RESUME in reply_options) == resumed
+        if resumed:
+            assert len(reply_options[ptp_header.OPT_RESUME]) == ptp_header.RESUME_VALUE.size + (max_chunks + 7) // 8
+    finally:
+        for flow in receiver.flows.values():
+            flow.close()
+        receiver.receiver_socket.close()
+        peer.close()
+
+
+def transfer(source: str, destination: str) -> Sender:
+    receiver = Receiver(0, 0, destination, 0, 0)
+    thread = threading.Thread(target=receiver.run, daemon=True)
+    thread.start()
+    sender = Sender(0, receiver.receiver_socket.getsockname()[1], source, 64000, 100)
+    sender.run()
+    thread.join(5)
+    receiver.close()
+    thread.join()
+    return sender
+
+
+def interrupted(source: bytes, destination: str, chunks: int) -> None:
+    '''leave destination as a transfer of source that died after its first chunks'''
+    progress = ptp_resume.Progress.create(destination, len(source), ptp_resume.CHUNK_SIZE,
+                                          ptp_resume.fingerprint(destination + ".source"))
+    writer = ptp_resume.ResumableWriter(open(destination, "wb"), progress, [(0, len(source))])
+    writer.write(source[:chunks * ptp_resume.CHUNK_SIZE])
+    writer.close()
+
+
+@pytest.mark.parametrize("same_file", [True, False])
+def test_resumed_transfer(tmp_path, monkeypatch, same_file):
+    monkeypatch.chdir(tmp_path)
+    size = 3 * ptp_resume.CHUNK_SIZE + 1000
+    source = tmp_path / "source"
+    source.write_bytes(random.Random(1).randbytes(size))
+    destination = str(tmp_path / "received")
+    # the earlier transfer was of this file, or of another one of the same size
+    (tmp_path / "received.source").write_bytes(source.read_bytes() if same_file else random.Random(2).randbytes(size))
+    interrupted((tmp_path / "received.source").read_bytes(), destination, 2)
+
+    sender = transfer(str(source), destination)
+    assert sender.resumed_bytes == (2 * ptp_resume.CHUNK_SIZE if same_file else 0)
+    with open(destination, "rb") as file:
+        assert file.read() == source.read_bytes()
+    assert not os.path.exists(destination + ptp_resume.SUFFIX)
@@ -0,0 +1,56 @@
+import pytest
+
+import ptp_congestion
+import ptp_header
+from ptp_rto import MIN_RTO, RTOEstimator
+from ptp_window import SendWindow
+
+
+def test_first_sample_and_smoothing():
+    rto = RTOEstimator(1.0)
+    assert rto.rto == 1.0
+    rto.sample(0.4)
+    assert (rto.srtt, rto.rttvar) == (0.4, 0.2)
+    assert rto.rto == pytest.approx(0.4 + 4 * 0.2)
+    rto.sample(0.8)
+    assert rto.rttvar == pytest.approx(0.75 * 0.2 + 0.25 * 0.4)
+    assert rto.srtt == pytest.approx(0.875 * 0.4 + 0.125 * 0.8)
+    assert rto.rto == pytest.approx(rto.srtt + 4 * rto.rttvar)
+
+
+def test_floor_and_backoff():
+    rto = RTOEstimator(0.05)
+    assert rto.rto == MIN_RTO
+    for _ in range(20):
+        rto.sample(0.001)
+    assert rto.rto == MIN_RTO
+    rto.backoff()
+    rto.backoff()
+    assert rto.rto == pytest.approx(4 * MIN_RTO)
+    for _ in range(20):
+        rto.backoff()
+    assert rto.rto == rto.max_rto
+    rto.sample(0.1)  # a fresh sample ends the backoff
+    assert rto.rto < 1.0
+
+
+def sent(window, offset, size, now):
+    header = ptp_header.pack(ptp_header.DATA, window.relative_0 + offset, version=1)
+    return window.send_new(header, b"x" * size, offset + size, now)
+
+
+def test_retransmitted_segments_give_no_rtt_sample():
+    rto = RTOEstimator(1.0)
+    window = SendWindow(1000, 8, rto, ptp_congestion.create("reno", 8), lambda header, payload: None)
+    sent(window, 0, 100, 0.0)
+    window.on_timers(1.0)
+    assert window.retransmitted == {0}
+    assert rto.backoffs == 1
+    # the ACK answers either transmission, so Karn's rule discards it
+    window.on_ack(1100, [], 1.05)
+    assert rto.samples == 0
+    assert rto.rto == 2.0
+    sent(window, 100, 100, 2.0)
+    window.on_ack(1200, [], 2.1)
+    assert rto.samples == 1
+    assert rto.srtt == pytest.approx(0.1)
@@ -0,0 +1,41 @@
+from ptp_scoreboard import Scoreboard
+
+
+def filled(sizes, capacity=8):
+    scoreboard = Scoreboard(capacity)
+    end = 0
+    for size in sizes:
+        end += size
+        scoreboard.add(b"header", b"x" * size, end)
+    return scoreboard
+
+
+def test_ack_releases_whole_segments():
+    scoreboard = filled([10, 10, 10])
+    assert len(scoreboard) == 3
+    assert scoreboard.bytes_in_flight() == 30
+    assert scoreboard.ack(15) == [0]
+    assert scoreboard.get(0) is None
+    assert scoreboard.bytes_in_flight() == 15
+    assert scoreboard.ack(15) == []  # a duplicate ACK
+    assert scoreboard.ack(30) == [1, 2]
+    assert len(scoreboard) == 0
+
+
+def test_full_and_ring_reuse():
+    scoreboard = filled([1, 1], capacity=2)
+    assert scoreboard.full()
+    scoreboard.ack(1)
+    assert not scoreboard.full()
+    assert scoreboard.add(b"header", b"x", 3) == 2
+    assert scoreboard.get(2)[2] == 3
+
+
+def test_sack_marks_covered_segments_once():
+    scoreboard = filled([10, 10, 10, 10])
+    assert scoreboard.sack(10, 30) == [1, 2]
+    assert scoreboard.get(1)[3] and scoreboard.get(2)[3]
+    assert scoreboard.sack(10, 40) == [3]
+    assert scoreboard.sack(5, 15) == []  # covers no segment completely
+    assert not scoreboard.get(0)[3]
+    assert scoreboard.ack(40) == [0, 1, 2, 3]
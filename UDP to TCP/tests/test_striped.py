@@ -0,0 +1,68 @@
+import ptp_header
+import ptp_striped
+from receiver import Receiver
+
+ADDRESS = ("127.0.0.1", 9)
+
+
+def test_split():
+    assert ptp_striped.split(10, 3, 2) == [(0, 4), (4, 4), (8, 2)]
+    assert ptp_striped.split(9, 2, 4) == [(0, 8), (8, 1)]  # stripes are made of whole segments
+    assert ptp_striped.split(3, 8, 4) == [(0, 3)]
+    assert ptp_striped.split(0, 4, 4) == [(0, 0)]
+    for size, stripes, mss in ((1000, 4, 100), (1001, 4, 100), (12345, 7, 1000)):
+        ranges = ptp_striped.split(size, stripes, mss)
+        assert len(ranges) <= stripes
+        assert sum(length for _, length in ranges) == size
+        assert all(offset + length == next_offset for (offset, length), (next_offset, _) in zip(ranges, ranges[1:]))
+
+
+def test_range_option():
+    options = {ptp_header.OPT_RANGE: ptp_header.RANGE_VALUE.pack(4096, 1 << 40)}
+    assert ptp_header.range_of(ptp_header.unpack_options(ptp_header.pack_options(options))) == (4096, 1 << 40)
+    assert ptp_header.range_of({}) is None
+    assert ptp_header.range_of({ptp_header.OPT_RANGE: b"short"}) is None
+
+
+def syn(seq_no, conn_id, offset, size):
+    options = ptp_header.pack_options({ptp_header.OPT_RANGE: ptp_header.RANGE_VALUE.pack(offset, size)})
+    return ptp_header.pack(ptp_header.SYN, seq_no, 0, options, conn_id=conn_id)
+
+
+def test_receiver_assembles_stripes_and_stops_once_all_are_in(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    receiver = Receiver(0, 0, str(tmp_path / "received"), 0, 0)
+    try:
+        data = b"0123456789"
+        stripes = ptp_striped.split(len(data), 3, 2)
+        # every stripe has a sequence space of its own, starting at 100 * conn_id
+        for conn_id, (offset, _) in reversed(list(enumerate(stripes, 1))):
+            assert not receiver.handle(syn(100 * conn_id, conn_id, offset, len(data)), ADDRESS)
+        # the segments of each stripe out of order, the stripes interleaved
+        for conn_id, (offset, length) in enumerate(stripes, 1):
+            for position in reversed(range(0, length, 2)):
+                segment = ptp_header.pack(ptp_header.DATA, 100 * conn_id + 1 + position, 0,
+                                          data[offset + position:offset + position + 2], conn_id=conn_id)
+                assert not receiver.handle(segment, ADDRESS)
+        fins = [ptp_header.pack(ptp_header.FIN, 100 * conn_id + 1 + length, conn_id=conn_id)
+                for conn_id, (_, length) in enumerate(stripes, 1)]
+        assert not receiver.handle(fins[2], ADDRESS)
+        assert not receiver.handle(fins[0], ADDRESS)
+        assert not receiver.handle(fins[0], ADDRESS)  # a retransmitted FIN does not count twice
+        assert receiver.handle(fins[1], ADDRESS)
+        assert (tmp_path / "received").read_bytes() == data
+        assert not receiver.striped
+    finally:
+        receiver.receiver_socket.close()
+
+
+def test_reset_of_one_stripe_does_not_end_the_transfer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    receiver = Receiver(0, 0, str(tmp_path / "received"), 0, 0)
+    try:
+        receiver.handle(syn(100, 1, 0, 4), ADDRESS)
+        receiver.handle(syn(200, 2, 2, 4), ADDRESS)
+        assert not receiver.handle(ptp_header.pack(ptp_header.RESET, 101, conn_id=1), ADDRESS)
+        assert list(receiver.flows) == [(ADDRESS, 2)]
+    finally:
+        receiver.receiver_socket.close()
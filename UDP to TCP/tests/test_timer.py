@@ -0,0 +1,67 @@
+import threading
+import time
+
+from ptp_timer import RetransmitTimer
+
+
+def test_expiry_in_deadline_order():
+    timer = RetransmitTimer()
+    with timer.cond:
+        timer.arm(2, 30.0)
+        timer.arm(1, 10.0)
+        timer.arm(3, 20.0)
+        assert timer.next_deadline() == 10.0
+        assert timer.pop_expired(25.0) == [1, 3]
+        assert timer.pop_expired(25.0) == []
+        assert 2 in timer and len(timer) == 1
+
+
+def test_rearm_and_cancel():
+    timer = RetransmitTimer()
+    with timer.cond:
+        timer.arm(1, 10.0)
+        timer.arm(1, 40.0)  # a retransmission restarts the timer
+        timer.arm(2, 20.0)
+        assert timer.cancel(2)
+        assert not timer.cancel(2)
+        assert timer.next_deadline() == 40.0
+        assert timer.pop_expired(30.0) == []
+        assert timer.pop_expired(40.0) == [1]
+        assert timer.next_deadline() is None
+
+
+def test_stale_entries_do_not_pile_up():
+    timer = RetransmitTimer()
+    with timer.cond:
+        for n in range(10_000):
+            timer.arm(n % 10, float(n))
+        assert len(timer) == 10
+        assert len(timer._heap) <= 2 * len(timer) + 64 + 1
+        assert timer.pop_expired(1e9) == list(range(10))
+
+
+def test_wait_returns_at_the_deadline():
+    timer = RetransmitTimer()
+    with timer.cond:
+        timer.arm(1, time.time() + 0.05)
+        start = time.monotonic()
+        timer.wait()
+        assert 0.03 < time.monotonic() - start < 1.0
+
+
+def test_notify_wakes_a_waiter_without_deadline():
+    timer = RetransmitTimer()
+    woken = threading.Event()
+
+    def waiter():
+        with timer.cond:
+            timer.wait()
+        woken.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.05)
+    with timer.cond:
+        timer.notify()
+    assert woken.wait(1.0)
+    thread.join()
@@ -0,0 +1,74 @@
+import os
+import signal
+
+import pytest
+
+import ptp_header
+import ptp_trace
+from receiver import Receiver
+
+ADDRESS = ("127.0.0.1", 9)
+
+
+def test_disabled_tracer_allocates_nothing():
+    tracer = ptp_trace.PacketTracer(capacity=4)
+    assert not tracer.enabled
+    assert tracer.records() == [] and len(tracer) == 0
+
+
+def test_ring_keeps_the_newest_records():
+    tracer = ptp_trace.PacketTracer(capacity=4, enabled=True)
+    for seq_no in range(10):
+        tracer.record(ptp_trace.SEND, ptp_header.DATA, seq_no, 0, 100)
+    assert len(tracer) == 4
+    records = tracer.records()
+    assert [record[3] for record in records] == [6, 7, 8, 9]
+    assert records[0][1:] == (ptp_trace.SEND, ptp_header.DATA, 6, 0, 100)
+    assert [record[0] for record in records] == sorted(record[0] for record in records)
+    tracer.disable()
+    assert tracer.records() == records  # disabling keeps what was recorded
+
+
+def test_dump_and_load(tmp_path):
+    tracer = ptp_trace.PacketTracer(capacity=8, enabled=True)
+    tracer.record(ptp_trace.SEND, ptp_header.DATA, 1001, 0, 1000)
+    tracer.record(ptp_trace.RECEIVE, ptp_header.ACK, 0, 2001, 0)
+    tracer.record(ptp_trace.DROP, ptp_header.FIN, ptp_header.SEQ_MODULO - 1, 0, 0)
+    path = str(tmp_path / "trace.bin")
+    tracer.dump(path)
+    records = ptp_trace.load(path)
+    assert records == tracer.records()
+    lines = ptp_trace.format_records(records).splitlines()
+    assert lines[0].split() == ["snd", "0.0", "DATA", "1001", "1000"]
+    assert lines[1].split()[2:] == ["ACK", "2001", "0"]
+    assert lines[2].split()[::2] == ["drop", "FIN", "0"]
+    (tmp_path / "other.bin").write_bytes(b"x" * 32)
+    with pytest.raises(ValueError):
+        ptp_trace.load(str(tmp_path / "other.bin"))
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGUSR1"), reason="no SIGUSR1 here")
+def test_sigusr1_toggles_the_tracer():
+    tracer = ptp_trace.PacketTracer()
+    previous = signal.getsignal(signal.SIGUSR1)
+    try:
+        assert ptp_trace.install_signal_toggle(tracer)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        assert tracer.enabled
+        os.kill(os.getpid(), signal.SIGUSR1)
+        assert not tracer.enabled
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+
+
+def test_ack_of_a_fin_at_the_end_of_the_sequence_space_is_traced(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    receiver = Receiver(0, 0, str(tmp_path / "received"), 0, 0)
+    try:
+        receiver.tracer.enable()
+        fin_seq = ptp_header.SEQ_MODULO - 1
+        receiver.handle(ptp_header.pack(ptp_header.SYN, fin_seq - 1, conn_id=1), ADDRESS)
+        assert receiver.handle(ptp_header.pack(ptp_header.FIN, fin_seq, conn_id=1), ADDRESS)
+        assert receiver.tracer.records()[-1][1:5] == (ptp_trace.SEND, ptp_header.ACK, 0, 0)
+    finally:
+        receiver.receiver_socket.close()
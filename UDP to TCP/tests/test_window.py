@@ -0,0 +1,53 @@
+import ptp_congestion
+import ptp_header
+import ptp_trace
+from ptp_rto import RTOEstimator
+from ptp_window import SendWindow
+from sender import Sender
+
+
+def test_window_probe_past_the_sequence_space_is_traced(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "file").write_bytes(b"")
+    sender = Sender(0, 9, str(tmp_path / "file"), 64000, 100)
+    try:
+        sender.tracer.enable()
+        sender.relative_0 = ptp_header.SEQ_MODULO - 10
+        sender.window.scoreboard.end_offset = 5 << 30  # a file over 4 GB
+        sender._window_probe()
+        expected = (sender.relative_0 + (5 << 30)) % ptp_header.SEQ_MODULO
+        assert sender.tracer.records()[-1][1:4] == (ptp_trace.SEND, ptp_header.DATA, expected)
+    finally:
+        sender.ptp_close()
+
+
+def test_window_scale_option():
+    payload = ptp_header.pack_options({ptp_header.OPT_WSCALE: ptp_header.WSCALE_VALUE.pack(5)})
+    options = ptp_header.unpack_options(payload)
+    assert ptp_header.window_scale_of(options) == 5
+    assert ptp_header.window_scale_of({ptp_header.OPT_WSCALE: ptp_header.WSCALE_VALUE.pack(40)}) == 16
+    assert ptp_header.window_scale_of({}) is None  # a peer without a receive window
+
+
+def sent(window, offset, size):
+    header = ptp_header.pack(ptp_header.DATA, window.relative_0 + offset, version=1)
+    return window.send_new(header, b"x" * size, offset + size, 0.0)
+
+
+def test_advertised_window_caps_new_data_and_persist_probes_it():
+    probes = []
+    window = SendWindow(0, 64, RTOEstimator(1.0), ptp_congestion.create("reno", 64),
+                        lambda header, payload: None, probe=lambda: probes.append(True))
+    assert window.can_send(1000)  # no window advertised yet
+    sent(window, 0, 1000)
+    window.on_ack(1000, [], 0.1, window=1500)
+    assert window.can_send(1500) and not window.can_send(1501)
+    sent(window, 1000, 1500)
+    window.on_ack(2500, [], 0.2, window=0)
+    assert not window.can_send(1) and len(window) == 0
+    window.persist(0.2)
+    window.on_timers(0.2 + window.rto.rto)
+    assert probes == [True]
+    assert window.persist_backoff == 1
+    assert window.on_ack(2500, [], 1.5, window=1000)  # opening the window is no duplicate ACK
+    assert window.dup_acks == 0 and window.can_send(1000)